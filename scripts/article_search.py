@@ -0,0 +1,489 @@
+#!/usr/bin/env python3
+"""
+Article Search
+Local full-text search over crawled DTC, TSB and procedure articles with BM25
+ranking. The index lives in vehicles.db next to the article store and is
+updated incrementally: only articles that are new, whose stored body or
+bucket changed or that gained vehicles since the last run are reindexed.
+
+The inverted index is an FTS5 table used for matching only. Each document is
+indexed as one token per distinct term, suffixed with the term's weighted
+frequency in the document (code hits count 10, title 5, body 1), plus its
+vehicle and bucket tokens. Rowids are (length << 32 | id), so within one
+(term, frequency) posting list rows come back in descending BM25 order.
+Search visits frequency combinations best first and stops as soon as no
+remaining combination can beat the current top k, so common terms cost a
+few posting-list reads instead of scoring every match. Scores are exact
+BM25 over code, title and body.
+
+Usage:
+    python article_search.py update                      # Index new/changed articles
+    python article_search.py search "water in trunk"
+    python article_search.py search P0301 --vehicle 188569:13820 --bucket "Diagnostic Trouble Codes"
+"""
+
+import argparse
+import hashlib
+import heapq
+import json
+import math
+import re
+import sqlite3
+import unicodedata
+from collections import Counter
+from html.parser import HTMLParser
+
+from article_store import ArticleStore
+from populate_db import DB_FILE
+
+# Configuration
+DEFAULT_LIMIT = 20
+UPDATE_BATCH = 1000
+# BM25 field weights: a code hit counts as 10 occurrences, a title hit as 5
+BM25_WEIGHTS = (10, 5, 1)  # code, title, body
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Queries whose smallest term (or vehicle) has at most this many documents are
+# scored exhaustively; larger ones go through the best-first combination walk
+EXHAUSTIVE_DOCS = 2000
+MAX_COMBINATIONS = 256  # Walk steps before falling back to exhaustive scoring
+SNIPPET_TOKENS = 12
+
+TOKEN_RE = re.compile(r'[^\W_]+', re.UNICODE)
+LENGTH_SHIFT = 32
+ID_MASK = (1 << LENGTH_SHIFT) - 1
+
+
+def init_search_tables(conn):
+    """Create the search index tables."""
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS article_index_docs (
+            id INTEGER PRIMARY KEY,
+            article_id TEXT NOT NULL UNIQUE,
+            bucket TEXT,
+            body_id INTEGER, -- article_bodies.id that was indexed, NULL if metadata only
+            vehicle_count INTEGER NOT NULL DEFAULT 0, -- vehicle_articles rows when indexed
+            length INTEGER NOT NULL -- tokens in code, title and body
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS article_index_text (
+            id INTEGER PRIMARY KEY REFERENCES article_index_docs(id),
+            code TEXT,
+            title TEXT,
+            body TEXT
+        )
+    ''')
+    # One token per (term, weighted frequency), plus _v<model id> and _b<bucket hash>
+    c.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS article_index_terms USING fts5(
+            tokens, tokenize = "unicode61 tokenchars '_'", detail = none
+        )
+    ''')
+    # Per (term, frequency): documents, and a lower bound on their length for score bounds
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS article_index_levels (
+            term TEXT NOT NULL,
+            level INTEGER NOT NULL,
+            docs INTEGER NOT NULL,
+            min_length INTEGER NOT NULL,
+            PRIMARY KEY (term, level)
+        ) WITHOUT ROWID
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS article_index_totals (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            docs INTEGER NOT NULL,
+            length INTEGER NOT NULL
+        )
+    ''')
+    c.execute("INSERT OR IGNORE INTO article_index_totals (id, docs, length) VALUES (0, 0, 0)")
+    conn.commit()
+
+
+class _TextExtractor(HTMLParser):
+    """Collects the visible text of an HTML/XML article."""
+
+    SKIP = {"script", "style", "head"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skip += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP and self._skip:
+            self._skip -= 1
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+
+def html_to_text(data):
+    parser = _TextExtractor()
+    parser.feed(data.decode("utf-8", errors="replace"))
+    parser.close()
+    return " ".join(" ".join(parser.parts).split())
+
+
+def normalize(text):
+    """Lowercase and strip diacritics, the same way for documents and queries."""
+    text = text.lower()
+    if not text.isascii():
+        text = "".join(ch for ch in unicodedata.normalize("NFKD", text) if not unicodedata.combining(ch))
+    return text
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(normalize(text)) if text else []
+
+
+def query_terms(text):
+    """Distinct normalized terms of a query, in order (all must match)."""
+    return list(dict.fromkeys(tokenize(text)))
+
+
+def weighted_frequencies(code, title, body):
+    """Return ({term: weighted frequency}, length) for a document."""
+    freqs = Counter()
+    length = 0
+    for text, weight in zip((code, title, body), BM25_WEIGHTS):
+        tokens = tokenize(text)
+        length += len(tokens)
+        for token in tokens:
+            freqs[token] += weight
+    return freqs, length
+
+
+def level_token(term, level):
+    return f'{term}_{level}'
+
+
+def vehicle_token(model_id):
+    return f"_v{model_id}"
+
+
+def bucket_token(bucket):
+    return "_b" + hashlib.blake2b((bucket or "").encode("utf-8"), digest_size=8).hexdigest()
+
+
+def quoted(token):
+    return f'"{token}"'
+
+
+def doc_rowid(doc_id, length):
+    return length << LENGTH_SHIFT | doc_id
+
+
+def idf(docs, df):
+    """BM25 inverse document frequency, floored like FTS5's bm25()."""
+    value = math.log((docs - df + 0.5) / (df + 0.5))
+    return value if value > 0 else 1e-6
+
+
+def term_score(freq, length, avg_length):
+    return freq * (BM25_K1 + 1) / (freq + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length))
+
+
+def make_snippet(body, terms):
+    """The SNIPPET_TOKENS-token window of body with the most query terms, hits in [brackets]."""
+    if not body:
+        return None
+    spans = [(m.start(), m.end(), normalize(m.group())) for m in TOKEN_RE.finditer(body)]
+    if not spans:
+        return None
+    wanted = set(terms)
+    hits = [token in wanted for _, _, token in spans]
+    best, best_hits = 0, -1
+    window = sum(hits[:SNIPPET_TOKENS])
+    for start in range(max(len(spans) - SNIPPET_TOKENS + 1, 1)):
+        if start:
+            window += hits[start + SNIPPET_TOKENS - 1] - hits[start - 1]
+        if window > best_hits:
+            best, best_hits = start, window
+    end = min(best + SNIPPET_TOKENS, len(spans))
+    parts, pos = [], spans[best][0]
+    for i in range(best, end):
+        s, e, _ = spans[i]
+        parts.append(body[pos:s])
+        parts.append(f"[{body[s:e]}]" if hits[i] else body[s:e])
+        pos = e
+    return ("…" if best else "") + "".join(parts) + ("…" if end < len(spans) else "")
+
+
+class ArticleSearchIndex:
+    """BM25-ranked search over the local article store."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        init_search_tables(conn)
+
+    def update(self, store):
+        """Index articles that are new, whose body or bucket changed or that gained vehicles.
+
+        Returns the number of articles (re)indexed.
+        """
+        rows = self.conn.execute('''
+            SELECT a.article_id, a.bucket, a.code, COALESCE(NULLIF(a.title, ''), a.description),
+                   ac.body_id, d.id, d.body_id
+            FROM articles a
+            LEFT JOIN article_contents ac ON ac.article_id = a.article_id AND ac.format = 'html'
+            LEFT JOIN article_index_docs d ON d.article_id = a.article_id
+            WHERE d.id IS NULL OR d.body_id IS NOT ac.body_id OR d.bucket IS NOT a.bucket
+               OR d.vehicle_count != (SELECT COUNT(*) FROM vehicle_articles va WHERE va.article_id = a.article_id)
+        ''').fetchall()
+
+        c = self.conn.cursor()
+        for i in range(0, len(rows), UPDATE_BATCH):
+            documents = []
+            for article_id, bucket, code, title, body_id, doc_id, indexed_body_id in rows[i:i + UPDATE_BATCH]:
+                model_ids = [r[0] for r in c.execute(
+                    "SELECT model_id FROM vehicle_articles WHERE article_id = ?", (article_id,))]
+                body = None
+                if doc_id is not None and indexed_body_id == body_id:
+                    # Only the vehicle mapping or bucket changed; reuse the text already indexed
+                    body = c.execute("SELECT body FROM article_index_text WHERE id = ?", (doc_id,)).fetchone()[0]
+                elif body_id is not None:
+                    stored = store.get(article_id)
+                    if stored:
+                        body = html_to_text(stored[1])
+                documents.append((article_id, bucket, body_id, code, title, body, model_ids))
+            self.index_documents(documents)
+        return len(rows)
+
+    def index_documents(self, documents):
+        """(Re)index (article_id, bucket, body_id, code, title, body, model_ids) tuples and commit."""
+        c = self.conn.cursor()
+        levels = {}  # (term, level) -> [docs delta, min length of added docs]
+        docs_delta = length_delta = 0
+        for article_id, bucket, body_id, code, title, body, model_ids in documents:
+            freqs, length = weighted_frequencies(code, title, body)
+            row = c.execute("SELECT id, length FROM article_index_docs WHERE article_id = ?", (article_id,)).fetchone()
+            if row:
+                doc_id, old_length = row
+                old_rowid = doc_rowid(doc_id, old_length)
+                (old_tokens,) = c.execute("SELECT tokens FROM article_index_terms WHERE rowid = ?",
+                                          (old_rowid,)).fetchone()
+                for token in old_tokens.split():
+                    if not token.startswith("_"):
+                        term, level = token.rsplit("_", 1)
+                        levels.setdefault((term, int(level)), [0, None])[0] -= 1
+                c.execute("DELETE FROM article_index_terms WHERE rowid = ?", (old_rowid,))
+                c.execute("UPDATE article_index_docs SET bucket = ?, body_id = ?, vehicle_count = ?, length = ? WHERE id = ?",
+                          (bucket, body_id, len(model_ids), length, doc_id))
+                docs_delta -= 1
+                length_delta -= old_length
+            else:
+                doc_id = c.execute(
+                    "INSERT INTO article_index_docs (article_id, bucket, body_id, vehicle_count, length) VALUES (?, ?, ?, ?, ?)",
+                    (article_id, bucket, body_id, len(model_ids), length)).lastrowid
+            c.execute("INSERT OR REPLACE INTO article_index_text (id, code, title, body) VALUES (?, ?, ?, ?)",
+                      (doc_id, code, title, body))
+
+            tokens = [level_token(term, level) for term, level in freqs.items()]
+            tokens += [vehicle_token(model_id) for model_id in model_ids]
+            tokens.append(bucket_token(bucket))
+            c.execute("INSERT INTO article_index_terms (rowid, tokens) VALUES (?, ?)",
+                      (doc_rowid(doc_id, length), " ".join(tokens)))
+            for key in freqs.items():
+                entry = levels.setdefault(key, [0, None])
+                entry[0] += 1
+                entry[1] = length if entry[1] is None else min(entry[1], length)
+            docs_delta += 1
+            length_delta += length
+
+        # min_length only ever decreases, so it stays a valid lower bound after removals
+        c.executemany('''
+            INSERT INTO article_index_levels (term, level, docs, min_length) VALUES (?, ?, ?, ?)
+            ON CONFLICT (term, level) DO UPDATE SET
+                docs = docs + excluded.docs, min_length = MIN(min_length, excluded.min_length)
+        ''', [(term, level, delta, min_length)
+              for (term, level), (delta, min_length) in levels.items() if min_length is not None])
+        c.executemany("UPDATE article_index_levels SET docs = docs + ? WHERE term = ? AND level = ?",
+                      [(delta, term, level)
+                       for (term, level), (delta, min_length) in levels.items() if min_length is None])
+        c.executemany("DELETE FROM article_index_levels WHERE term = ? AND level = ? AND docs <= 0",
+                      [(term, level) for (term, level), (delta, _) in levels.items() if delta < 0])
+        c.execute("UPDATE article_index_totals SET docs = docs + ?, length = length + ? WHERE id = 0",
+                  (docs_delta, length_delta))
+        self.conn.commit()
+
+    def optimize(self):
+        """Merge FTS segments; worth running after a large update."""
+        self.conn.execute("INSERT INTO article_index_terms (article_index_terms) VALUES ('optimize')")
+        self.conn.commit()
+
+    def _rowids(self, expression):
+        return self.conn.execute(
+            "SELECT rowid FROM article_index_terms WHERE article_index_terms MATCH ? ORDER BY rowid", (expression,))
+
+    def _exhaustive(self, terms, term_levels, driver, filters):
+        """{rowid: [level per term]} for every document matching all terms and filters."""
+        found = None
+        for i, term in enumerate(terms):
+            matches = {}
+            for level, _, _ in term_levels[term]:
+                expression = " AND ".join([quoted(level_token(term, level)), driver] + filters)
+                for (rowid,) in self._rowids(expression):
+                    if found is None or rowid in found:
+                        matches[rowid] = level
+            if found is None:
+                found = {rowid: [level] for rowid, level in matches.items()}
+            else:
+                found = {rowid: found[rowid] + [level] for rowid, level in matches.items()}
+            if not found:
+                break
+        return found or {}
+
+    def _ranked(self, terms, vehicle_model, bucket, limit):
+        """Top `limit` (score, rowid) pairs, best first."""
+        rows = self.conn.execute(f'''
+            SELECT term, level, docs, min_length FROM article_index_levels
+            WHERE term IN ({", ".join("?" * len(terms))})
+        ''', terms).fetchall()
+        term_levels = {term: [] for term in terms}
+        for term, level, docs, min_length in rows:
+            term_levels[term].append((level, docs, min_length))
+        if not all(term_levels.values()):
+            return []
+        total_docs, total_length = self.conn.execute(
+            "SELECT docs, length FROM article_index_totals WHERE id = 0").fetchone()
+        avg_length = total_length / total_docs if total_docs else 1.0
+        weights = [idf(total_docs, sum(docs for _, docs, _ in term_levels[term])) for term in terms]
+
+        def score(levels, length):
+            return sum(w * term_score(level, length, avg_length) for w, level in zip(weights, levels))
+
+        filters = []
+        if vehicle_model is not None:
+            filters.append(quoted(vehicle_token(vehicle_model)))
+        if bucket:
+            filters.append(quoted(bucket_token(bucket)))
+
+        # Small match sets are cheapest to score in full: drive every term-level lookup by the
+        # rarest term (or the vehicle, whose article list is short)
+        rarest = min(terms, key=lambda t: sum(docs for _, docs, _ in term_levels[t]))
+        rarest_docs = sum(docs for _, docs, _ in term_levels[rarest])
+        rarest_driver = "(" + " OR ".join(quoted(level_token(rarest, level)) for level, _, _ in term_levels[rarest]) + ")"
+        vehicle_docs = self.conn.execute("SELECT COUNT(*) FROM vehicle_articles WHERE model_id = ?",
+                                         (vehicle_model,)).fetchone()[0] if vehicle_model is not None else None
+        if vehicle_docs is not None and vehicle_docs <= min(rarest_docs, EXHAUSTIVE_DOCS):
+            return self._score_all(terms, term_levels, filters[0], filters[1:], score, limit)
+        if rarest_docs <= EXHAUSTIVE_DOCS:
+            return self._score_all(terms, term_levels, rarest_driver, filters, score, limit)
+
+        # Best-first walk over level combinations. Each term's levels are ordered by their score
+        # bound; a combination's bound is the sum of its terms' bounds, and neighbours never
+        # exceed their parent, so once the popped bound is <= the k-th score nothing left can
+        # enter the top k. Within a combination rows come back by length, i.e. by score.
+        options = []
+        for term, w in zip(terms, weights):
+            options.append(sorted(((w * term_score(level, min_length, avg_length), level)
+                                   for level, _, min_length in term_levels[term]), reverse=True))
+        top = []  # min-heap of (score, -rowid)
+        start = (0,) * len(terms)
+        frontier = [(-sum(o[0][0] for o in options), start)]
+        seen = {start}
+        steps = 0
+        while frontier:
+            bound, combination = heapq.heappop(frontier)
+            if len(top) == limit and -bound <= top[0][0]:
+                break
+            steps += 1
+            if steps > MAX_COMBINATIONS:
+                return self._score_all(terms, term_levels, rarest_driver, filters, score, limit)
+            levels = [options[i][j][1] for i, j in enumerate(combination)]
+            expression = " AND ".join([quoted(level_token(t, l)) for t, l in zip(terms, levels)] + filters)
+            for (rowid,) in self._rowids(expression):
+                value = score(levels, rowid >> LENGTH_SHIFT)
+                if len(top) < limit:
+                    heapq.heappush(top, (value, -rowid))
+                elif value > top[0][0]:
+                    heapq.heapreplace(top, (value, -rowid))
+                else:
+                    break  # Longer documents in this combination only score lower
+            for i in range(len(terms)):
+                if combination[i] + 1 < len(options[i]):
+                    neighbour = combination[:i] + (combination[i] + 1,) + combination[i + 1:]
+                    if neighbour not in seen:
+                        seen.add(neighbour)
+                        heapq.heappush(frontier, (-sum(options[k][j][0] for k, j in enumerate(neighbour)),
+                                                  neighbour))
+        return [(value, -neg_rowid) for value, neg_rowid in sorted(top, reverse=True)]
+
+    def _score_all(self, terms, term_levels, driver, filters, score, limit):
+        found = self._exhaustive(terms, term_levels, driver, filters)
+        ranked = sorted(((score(levels, rowid >> LENGTH_SHIFT), rowid) for rowid, levels in found.items()),
+                        key=lambda item: (-item[0], item[1]))
+        return ranked[:limit]
+
+    def search(self, text, vehicle_id=None, bucket=None, limit=DEFAULT_LIMIT):
+        """Return ranked matches shaped like articles/v2 articleDetails, plus score and snippet.
+
+        Every term must match; results are the exact BM25 top `limit` over the filtered set.
+        """
+        terms = query_terms(text)
+        if not terms or limit <= 0:
+            return []
+        vehicle_model = None
+        if vehicle_id:
+            row = self.conn.execute("SELECT id FROM models WHERE vehicle_id = ?", (vehicle_id,)).fetchone()
+            if not row:
+                return []
+            vehicle_model = row[0]
+
+        top = self._ranked(terms, vehicle_model, bucket, limit)
+        if not top:
+            return []
+        ids = [rowid & ID_MASK for _, rowid in top]
+        marks = ", ".join("?" * len(ids))
+        details = {row[0]: row[1:] for row in self.conn.execute(f'''
+            SELECT d.id, d.article_id, d.bucket, a.code, COALESCE(NULLIF(a.title, ''), a.description), t.body
+            FROM article_index_docs d
+            JOIN articles a ON a.article_id = d.article_id
+            JOIN article_index_text t ON t.id = d.id
+            WHERE d.id IN ({marks})
+        ''', ids)}
+
+        results = []
+        for (value, _), doc_id in zip(top, ids):
+            article_id, doc_bucket, code, title, body = details[doc_id]
+            results.append({"id": article_id, "bucket": doc_bucket, "code": code, "title": title,
+                            "score": round(value, 4), "snippet": make_snippet(body, terms)})
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local full-text article search")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    upd = sub.add_parser("update", help="Index new and changed articles")
+    upd.add_argument("--optimize", action="store_true", help="Merge index segments afterwards")
+
+    srch = sub.add_parser("search", help="Search the index")
+    srch.add_argument("query")
+    srch.add_argument("--vehicle", help="Only articles for this vehicleId")
+    srch.add_argument("--bucket", help='e.g. "Technical Service Bulletins"')
+    srch.add_argument("--limit", type=int, default=DEFAULT_LIMIT)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(DB_FILE)
+    index = ArticleSearchIndex(conn)
+    if args.command == "update":
+        count = index.update(ArticleStore(conn))
+        if args.optimize:
+            index.optimize()
+        print(f"✅ Indexed {count} new or changed articles")
+    else:
+        print(json.dumps(index.search(args.query, args.vehicle, args.bucket, args.limit), indent=2))
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+Article Store
+Crawls procedure, TSB and DTC article bodies into vehicles.db once per
+article instead of once per vehicle. Bodies are deduplicated by SHA-256 and
+compressed (zstd with a trained dictionary when the `zstandard` package is
+installed, zlib otherwise); vehicle_articles maps vehicles to the articles
+they list.
+
+The proxy's /dtc/{articleId} and /tsb/{articleId} routes redirect to
+/article/{articleId}, so all three are stored as the 'html' format;
+/xml/{articleId} is stored as 'xml'.
+
+Usage:
+    python article_store.py crawl                        # All vehicles in vehicles.db
+    python article_store.py crawl --vehicle 188569:13820 --xml
+    python article_store.py train                        # Train a dictionary and recompress
+    python article_store.py get TSB:468775993
+"""
+
+import argparse
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import zlib
+from urllib.parse import quote
+
+import aiohttp
+from tqdm.asyncio import tqdm
+
+import metrics
+from populate_db import BASE_URL, CONCURRENT_REQUESTS, DB_FILE, fetch_json, init_db
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; bodies fall back to zlib
+    zstandard = None
+
+# Configuration
+CONTENT_SOURCE = "MOTOR"
+STALE_AFTER_DAYS = 30      # Stored articles older than this are refetched
+ZSTD_LEVEL = 19
+ZLIB_LEVEL = 9
+DICT_SIZE = 112 * 1024     # Trained dictionary size in bytes
+DICT_SAMPLES = 5000        # Bodies sampled when training a dictionary
+RECOMPRESS_BATCH = 500
+
+
+def init_article_tables(conn):
+    """Create the article store tables."""
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS compression_dicts (
+            id INTEGER PRIMARY KEY,
+            codec TEXT NOT NULL,
+            data BLOB NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS article_bodies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, -- never reused, so a stale id can't match a new body
+            hash TEXT NOT NULL UNIQUE, -- sha256 hex of the uncompressed body
+            codec TEXT NOT NULL, -- 'zstd', 'zlib'
+            dict_id INTEGER REFERENCES compression_dicts(id),
+            raw_size INTEGER NOT NULL,
+            content_type TEXT,
+            body BLOB NOT NULL
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS articles (
+            article_id TEXT PRIMARY KEY, -- e.g. TSB:468775993
+            bucket TEXT,
+            title TEXT,
+            subtitle TEXT,
+            code TEXT,
+            description TEXT
+        ) WITHOUT ROWID
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS article_contents (
+            article_id TEXT NOT NULL,
+            format TEXT NOT NULL, -- 'html', 'xml'
+            body_id INTEGER NOT NULL REFERENCES article_bodies(id),
+            fetched_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (article_id, format)
+        ) WITHOUT ROWID
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_article_contents_body ON article_contents(body_id)')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS vehicle_articles (
+            model_id INTEGER NOT NULL, -- models.id
+            article_id TEXT NOT NULL,
+            PRIMARY KEY (model_id, article_id)
+        ) WITHOUT ROWID
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_vehicle_articles_article ON vehicle_articles(article_id)')
+    conn.commit()
+
+
+class ArticleStore:
+    """Deduplicated, compressed article bodies in the vehicles database."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        init_article_tables(conn)
+        self._dicts = {}
+        row = conn.execute("SELECT MAX(id) FROM compression_dicts WHERE codec = 'zstd'").fetchone()
+        self.dict_id = row[0] if zstandard else None
+
+    def _dictionary(self, dict_id):
+        if dict_id not in self._dicts:
+            data = self.conn.execute("SELECT data FROM compression_dicts WHERE id = ?", (dict_id,)).fetchone()[0]
+            self._dicts[dict_id] = zstandard.ZstdCompressionDict(data)
+        return self._dicts[dict_id]
+
+    def compress(self, data):
+        """Return (codec, dict_id, blob) using the newest dictionary if there is one."""
+        if zstandard is None:
+            return 'zlib', None, zlib.compress(data, ZLIB_LEVEL)
+        if self.dict_id:
+            compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=self._dictionary(self.dict_id))
+        else:
+            compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+        return 'zstd', self.dict_id, compressor.compress(data)
+
+    def decompress(self, codec, dict_id, blob):
+        if codec == 'zlib':
+            return zlib.decompress(blob)
+        if zstandard is None:
+            raise RuntimeError("Body is zstd-compressed; install the 'zstandard' package to read it")
+        if dict_id:
+            return zstandard.ZstdDecompressor(dict_data=self._dictionary(dict_id)).decompress(blob)
+        return zstandard.ZstdDecompressor().decompress(blob)
+
+    def put_body(self, data, content_type=None):
+        """Store a body once per content hash and return its id."""
+        digest = hashlib.sha256(data).hexdigest()
+        row = self.conn.execute("SELECT id FROM article_bodies WHERE hash = ?", (digest,)).fetchone()
+        if row:
+            return row[0]
+        codec, dict_id, blob = self.compress(data)
+        c = self.conn.execute(
+            "INSERT INTO article_bodies (hash, codec, dict_id, raw_size, content_type, body) VALUES (?, ?, ?, ?, ?, ?)",
+            (digest, codec, dict_id, len(data), content_type, blob)
+        )
+        return c.lastrowid
+
+    def put_article(self, article_id, fmt, data, content_type=None):
+        row = self.conn.execute(
+            "SELECT body_id FROM article_contents WHERE article_id = ? AND format = ?", (article_id, fmt)
+        ).fetchone()
+        body_id = self.put_body(data, content_type)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO article_contents (article_id, format, body_id, fetched_at) VALUES (?, ?, ?, CURRENT_TIMESTAMP)",
+            (article_id, fmt, body_id)
+        )
+        if row and row[0] != body_id:
+            # The article changed; drop its previous body unless another article shares it
+            self.conn.execute(
+                "DELETE FROM article_bodies WHERE id = ? AND NOT EXISTS (SELECT 1 FROM article_contents WHERE body_id = ?)",
+                (row[0], row[0])
+            )
+        self.conn.commit()
+
+    def prune_bodies(self):
+        """Delete bodies no article points at any more. Returns the number removed."""
+        c = self.conn.execute(
+            "DELETE FROM article_bodies WHERE NOT EXISTS (SELECT 1 FROM article_contents ac WHERE ac.body_id = article_bodies.id)"
+        )
+        self.conn.commit()
+        return c.rowcount
+
+    def get(self, article_id, fmt='html'):
+        """Return (content_type, bytes) for a stored article, or None."""
+        row = self.conn.execute('''
+            SELECT b.codec, b.dict_id, b.body, b.content_type FROM article_contents ac
+            JOIN article_bodies b ON b.id = ac.body_id
+            WHERE ac.article_id = ? AND ac.format = ?
+        ''', (article_id, fmt)).fetchone()
+        if not row:
+            return None
+        codec, dict_id, blob, content_type = row
+        return content_type, self.decompress(codec, dict_id, blob)
+
+    def is_current(self, article_id, fmt='html'):
+        row = self.conn.execute(
+            "SELECT 1 FROM article_contents WHERE article_id = ? AND format = ? AND fetched_at >= datetime('now', ?)",
+            (article_id, fmt, f'-{STALE_AFTER_DAYS} days')
+        ).fetchone()
+        return row is not None
+
+    def train_dictionary(self):
+        """Train a zstd dictionary from stored bodies and recompress everything with it."""
+        if zstandard is None:
+            raise RuntimeError("Dictionary training needs the 'zstandard' package")
+        # Orphaned bodies would skew the samples and be recompressed for nothing
+        self.prune_bodies()
+        rows = self.conn.execute(
+            "SELECT codec, dict_id, body FROM article_bodies ORDER BY RANDOM() LIMIT ?", (DICT_SAMPLES,)
+        ).fetchall()
+        samples = [self.decompress(*row) for row in rows]
+        if len(samples) < 10:
+            raise RuntimeError(f"Need at least 10 stored bodies to train a dictionary, have {len(samples)}")
+        trained = zstandard.train_dictionary(DICT_SIZE, samples)
+
+        c = self.conn.cursor()
+        c.execute("INSERT INTO compression_dicts (codec, data) VALUES ('zstd', ?)", (trained.as_bytes(),))
+        self.dict_id = c.lastrowid
+        self._dicts[self.dict_id] = trained
+        self.conn.commit()
+
+        last_id = 0
+        while True:
+            batch = c.execute(
+                "SELECT id, codec, dict_id, body FROM article_bodies WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, RECOMPRESS_BATCH)
+            ).fetchall()
+            if not batch:
+                break
+            updates = []
+            for body_id, codec, dict_id, blob in batch:
+                if dict_id != self.dict_id:
+                    updates.append(self.compress(self.decompress(codec, dict_id, blob)) + (body_id,))
+            c.executemany("UPDATE article_bodies SET codec = ?, dict_id = ?, body = ? WHERE id = ?", updates)
+            self.conn.commit()
+            last_id = batch[-1][0]
+
+        c.execute("DELETE FROM compression_dicts WHERE id NOT IN (SELECT DISTINCT dict_id FROM article_bodies WHERE dict_id IS NOT NULL) AND id != ?",
+                  (self.dict_id,))
+        self.conn.commit()
+        c.execute('VACUUM')
+        return self.dict_id
+
+
+async def fetch_body(session, url):
+    """Fetch a raw (HTML/XML) body. Returns (content_type, bytes) or None."""
+    try:
+        with metrics.track_request(url) as outcome:
+            async with session.get(url) as response:
+                outcome["status"] = response.status
+                if response.status == 200:
+                    return response.headers.get("Content-Type"), await response.read()
+                logging.error(f"Failed to fetch {url}: Status {response.status}")
+                return None
+    except aiohttp.ClientError as e:
+        logging.error(f"Client error fetching {url}: {e}", exc_info=True)
+        return None
+    except asyncio.TimeoutError:
+        logging.error(f"Timeout fetching {url}")
+        return None
+
+
+def article_url(vehicle_id, article_id, fmt):
+    if fmt == 'xml':
+        return f"{BASE_URL}/source/{CONTENT_SOURCE}/xml/{quote(article_id, safe='')}"
+    return f"{BASE_URL}/source/{CONTENT_SOURCE}/vehicle/{quote(vehicle_id, safe='')}/article/{quote(article_id, safe='')}"
+
+
+async def crawl_vehicle(session, store, model_id, vehicle_id, formats, pending, semaphore):
+    """List a vehicle's articles, map them, and fetch only bodies not already stored."""
+    url = f"{BASE_URL}/source/{CONTENT_SOURCE}/vehicle/{quote(vehicle_id, safe='')}/articles/v2"
+    async with semaphore:
+        data = await fetch_json(session, url)
+    if not data or 'articleDetails' not in data:
+        return 0
+
+    details = [a for a in data['articleDetails'] if a.get('id')]
+    try:
+        c = store.conn.cursor()
+        c.executemany(
+            "INSERT OR REPLACE INTO articles (article_id, bucket, title, subtitle, code, description) VALUES (?, ?, ?, ?, ?, ?)",
+            [(a['id'], a.get('bucket'), a.get('title'), a.get('subtitle'), a.get('code'), a.get('description'))
+             for a in details]
+        )
+        c.executemany(
+            "INSERT OR IGNORE INTO vehicle_articles (model_id, article_id) VALUES (?, ?)",
+            [(model_id, a['id']) for a in details]
+        )
+        store.conn.commit()
+    except sqlite3.Error as e:
+        logging.error(f"Database error for articles of {vehicle_id}: {e}")
+        return 0
+
+    # `pending` is shared across vehicles so an article listed by many of them is fetched once
+    todo = []
+    for a in details:
+        for fmt in formats:
+            key = (a['id'], fmt)
+            if key in pending or store.is_current(*key):
+                metrics.CACHE_LOOKUPS.inc(cache="article_bodies", result="hit")
+                continue
+            metrics.CACHE_LOOKUPS.inc(cache="article_bodies", result="miss")
+            pending.add(key)
+            todo.append(key)
+
+    async def fetch_one(article_id, fmt):
+        async with semaphore:
+            result = await fetch_body(session, article_url(vehicle_id, article_id, fmt))
+        if result:
+            content_type, body = result
+            store.put_article(article_id, fmt, body, content_type)
+            return 1
+        pending.discard((article_id, fmt))
+        return 0
+
+    return sum(await asyncio.gather(*(fetch_one(*key) for key in todo)))
+
+
+async def crawl(vehicle_ids=None, xml=False):
+    conn = init_db()
+    store = ArticleStore(conn)
+    formats = ['html', 'xml'] if xml else ['html']
+
+    vehicles = conn.execute("SELECT id, vehicle_id FROM models").fetchall()
+    if vehicle_ids:
+        wanted = set(vehicle_ids)
+        vehicles = [v for v in vehicles if v[1] in wanted]
+
+    timeout = aiohttp.ClientTimeout(total=60)
+    connector = aiohttp.TCPConnector(ssl=False)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector, headers={"User-Agent": "VehicleDBPopulator/1.0"}) as session:
+        semaphore = metrics.TrackedSemaphore(CONCURRENT_REQUESTS, "article_store")
+        pending = set()
+        tasks = [crawl_vehicle(session, store, model_id, vehicle_id, formats, pending, semaphore)
+                 for model_id, vehicle_id in vehicles]
+        fetched = 0
+        for f in tqdm.as_completed(tasks, total=len(tasks), desc="Crawling Articles"):
+            fetched += await f
+
+    bodies, raw, stored = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(raw_size), 0), COALESCE(SUM(LENGTH(body)), 0) FROM article_bodies"
+    ).fetchone()
+    conn.close()
+    print(f"\n✅ Fetched {fetched} article bodies; store holds {bodies} unique bodies "
+          f"({raw} bytes raw, {stored} bytes compressed)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deduplicated article store")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    cr = sub.add_parser("crawl", help="Fetch article bodies for vehicles")
+    cr.add_argument("--vehicle", action="append", help="Only this vehicleId (repeatable)")
+    cr.add_argument("--xml", action="store_true", help="Also store the XML form of each article")
+    metrics.add_arguments(cr, "article_store")
+
+    train = sub.add_parser("train", help="Train a zstd dictionary and recompress stored bodies")
+    metrics.add_arguments(train, "article_store")
+
+    get = sub.add_parser("get", help="Print a stored article")
+    get.add_argument("article_id")
+    get.add_argument("--format", default="html", choices=["html", "xml"])
+    args = parser.parse_args()
+
+    if args.command == "crawl":
+        with metrics.instrumented(args):
+            asyncio.run(crawl(args.vehicle, xml=args.xml))
+    elif args.command == "train":
+        store = ArticleStore(sqlite3.connect(DB_FILE))
+        with metrics.instrumented(args):
+            dictionary_id = store.train_dictionary()
+        print(f"✅ Trained dictionary {dictionary_id}")
+    else:
+        result = ArticleStore(sqlite3.connect(DB_FILE)).get(args.article_id, args.format)
+        if result is None:
+            print(f"❌ {args.article_id} ({args.format}) is not stored")
+        else:
+            print(result[1].decode("utf-8", errors="replace"))
+
+
+if __name__ == "__main__":
+    main()
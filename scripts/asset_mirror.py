@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Asset & Graphic Mirror
+Mirrors wiring diagrams, illustrations and other binary assets into a
+content-addressed store. Each unique body is written once under its SHA-256;
+handles (the proxy paths) map to hashes in vehicles.db. A small local server
+serves the mirror over the same routes as the proxy.
+
+Usage:
+    python asset_mirror.py mirror asset/550e8400-e29b-41d4-a716-446655440000 source/MOTOR/graphic/12121061
+    python asset_mirror.py mirror "source/MOTOR/graphic/12121061?w=300&h=200"   # a resized variant
+    python asset_mirror.py mirror --from-file handles.txt
+    python asset_mirror.py serve --port 8081
+"""
+
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlencode
+
+import aiohttp
+from tqdm.asyncio import tqdm
+
+import metrics
+from populate_db import BASE_URL, CONCURRENT_REQUESTS, DB_FILE
+
+# Configuration
+ASSET_DIR = "assets"
+CHUNK_SIZE = 64 * 1024
+DEFAULT_PORT = 8081
+
+# Proxy routes served from the mirror, relative to /api
+HANDLE_ROUTES = [
+    re.compile(r'^asset/[^/]+$'),
+    re.compile(r'^source/[^/]+/graphic/[^/]+$'),
+    re.compile(r'^manufacturer/[^/]+/graphic/[^/]+$'),
+]
+# Graphic routes take optional resize parameters; each size is a separate handle
+GRAPHIC_RE = re.compile(r'^(?:source|manufacturer)/[^/]+/graphic/[^/]+$')
+GRAPHIC_PARAMS = ("w", "h")
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+UNSATISFIABLE = "unsatisfiable"  # parse_range result answered with 416
+
+
+def init_asset_tables(conn):
+    """Create the blob and handle index tables."""
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS asset_blobs (
+            hash TEXT PRIMARY KEY, -- sha256 hex of the body
+            size INTEGER NOT NULL,
+            content_type TEXT
+        ) WITHOUT ROWID
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS asset_handles (
+            handle TEXT PRIMARY KEY, -- proxy path, e.g. source/MOTOR/graphic/12121061
+            hash TEXT NOT NULL REFERENCES asset_blobs(hash)
+        ) WITHOUT ROWID
+    ''')
+    conn.commit()
+
+
+def blob_path(digest, asset_dir=ASSET_DIR):
+    """Location of a blob in the store: assets/ab/abcdef..."""
+    return os.path.join(asset_dir, digest[:2], digest)
+
+
+def handle_key(path):
+    """Normalize a proxy URL or request path to a handle: relative to /api, unquoted.
+
+    Graphic handles keep their w/h resize parameters as a sorted query; any other
+    query parameters are dropped.
+    """
+    path, _, query = path.partition("?")
+    handle = unquote(("/" + path.lstrip("/")).rsplit("/api/", 1)[-1]).strip("/")
+    params = {k: v for k, v in parse_qsl(query) if k in GRAPHIC_PARAMS and v}
+    if params and GRAPHIC_RE.match(handle):
+        handle += "?" + urlencode(sorted(params.items()))
+    return handle
+
+
+def is_asset_handle(handle):
+    return any(route.match(handle.split('?', 1)[0]) for route in HANDLE_ROUTES)
+
+
+async def mirror_asset(session, conn, handle, semaphore, asset_dir=ASSET_DIR):
+    """Stream one asset to the store, hashing as it downloads. Returns the hash or None."""
+    row = conn.execute("SELECT hash FROM asset_handles WHERE handle = ?", (handle,)).fetchone()
+    if row:
+        metrics.CACHE_LOOKUPS.inc(cache="assets", result="hit")
+        return row[0]
+    metrics.CACHE_LOOKUPS.inc(cache="assets", result="miss")
+
+    url = f"{BASE_URL}/{handle}"
+    os.makedirs(asset_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=asset_dir, suffix=".part")
+    try:
+        hasher = hashlib.sha256()
+        size = 0
+        async with semaphore:
+            with metrics.track_request(url) as outcome:
+                async with session.get(url) as response:
+                    outcome["status"] = response.status
+                    if response.status != 200:
+                        logging.error(f"Failed to fetch {url}: Status {response.status}")
+                        return None
+                    content_type = response.headers.get("Content-Type")
+                    with os.fdopen(fd, "wb") as out:
+                        fd = None
+                        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                            hasher.update(chunk)
+                            out.write(chunk)
+                            size += len(chunk)
+
+        digest = hasher.hexdigest()
+        path = blob_path(digest, asset_dir)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        tmp_path = None
+
+        c = conn.cursor()
+        c.execute("INSERT OR IGNORE INTO asset_blobs (hash, size, content_type) VALUES (?, ?, ?)",
+                  (digest, size, content_type))
+        c.execute("INSERT OR REPLACE INTO asset_handles (handle, hash) VALUES (?, ?)", (handle, digest))
+        conn.commit()
+        return digest
+    except aiohttp.ClientError as e:
+        logging.error(f"Client error fetching {url}: {e}", exc_info=True)
+        return None
+    except asyncio.TimeoutError:
+        logging.error(f"Timeout fetching {url}")
+        return None
+    finally:
+        if fd is not None:
+            os.close(fd)
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+async def mirror(handles):
+    """Mirror a list of handles, skipping ones already indexed."""
+    conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+    init_asset_tables(conn)
+
+    handles = [handle_key(h.strip()) for h in handles if h.strip()]
+    unknown = [h for h in handles if not is_asset_handle(h)]
+    for h in unknown:
+        print(f"⚠️ Skipping unsupported handle: {h}")
+    handles = [h for h in handles if is_asset_handle(h)]
+
+    timeout = aiohttp.ClientTimeout(total=120)
+    connector = aiohttp.TCPConnector(ssl=False)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector, headers={"User-Agent": "VehicleDBPopulator/1.0"}) as session:
+        semaphore = metrics.TrackedSemaphore(CONCURRENT_REQUESTS, "asset_mirror")
+        tasks = [mirror_asset(session, conn, h, semaphore) for h in handles]
+        results = []
+        for f in tqdm.as_completed(tasks, total=len(tasks), desc="Mirroring Assets"):
+            results.append(await f)
+
+    blobs, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM asset_blobs").fetchone()
+    conn.close()
+    ok = sum(1 for r in results if r)
+    print(f"\n✅ Mirrored {ok}/{len(handles)} handles; store holds {blobs} unique blobs ({total} bytes)")
+
+
+def parse_range(header, size):
+    """Parse a single-range 'bytes=a-b' header.
+
+    Returns (start, end) inclusive; None when the header should be ignored and the
+    full body sent (multiple ranges, or a header that does not parse, per RFC 9110);
+    or UNSATISFIABLE when the range starts at or past the end of the body.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            return UNSATISFIABLE
+        return max(size - length, 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        return UNSATISFIABLE
+    end = min(int(last), size - 1) if last else size - 1
+    return start, end
+
+
+class AssetRequestHandler(BaseHTTPRequestHandler):
+    """Serves mirrored blobs over the proxy's asset and graphic routes."""
+
+    db_file = DB_FILE
+    asset_dir = ASSET_DIR
+
+    def lookup(self):
+        path = handle_key(self.path)
+        if not is_asset_handle(path):
+            return None
+        conn = sqlite3.connect(self.db_file)
+        try:
+            return conn.execute('''
+                SELECT b.hash, b.size, b.content_type FROM asset_handles h
+                JOIN asset_blobs b ON b.hash = h.hash
+                WHERE h.handle = ?
+            ''', (path,)).fetchone()
+        finally:
+            conn.close()
+
+    def do_HEAD(self):
+        self.serve(send_body=False)
+
+    def do_GET(self):
+        self.serve(send_body=True)
+
+    def serve(self, send_body):
+        row = self.lookup()
+        if not row:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        digest, size, content_type = row
+        etag = f'"{digest}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        start, end = 0, size - 1
+        status = HTTPStatus.OK
+        range_header = self.headers.get("Range")
+        if range_header:
+            byte_range = parse_range(range_header, size)
+            if byte_range == UNSATISFIABLE:
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.end_headers()
+                return
+            if byte_range is not None:
+                start, end = byte_range
+                status = HTTPStatus.PARTIAL_CONTENT
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type or "application/octet-stream")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+        if status == HTTPStatus.PARTIAL_CONTENT:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+
+        if send_body and size:
+            self.wfile.flush()
+            with open(blob_path(digest, self.asset_dir), "rb") as f:
+                # socket.sendfile uses os.sendfile where available (zero-copy)
+                self.connection.sendfile(f, offset=start, count=end - start + 1)
+
+
+def serve(port):
+    server = ThreadingHTTPServer(("", port), AssetRequestHandler)
+    print(f"🖼️ Serving mirrored assets from '{ASSET_DIR}' on http://localhost:{port}/api/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Content-addressed asset and graphic mirror")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    mir = sub.add_parser("mirror", help="Download assets into the store")
+    mir.add_argument("handles", nargs="*", help="Proxy paths, e.g. asset/{handleId}")
+    mir.add_argument("--from-file", help="File with one handle per line")
+    metrics.add_arguments(mir, "asset_mirror")
+
+    srv = sub.add_parser("serve", help="Serve the store over HTTP")
+    srv.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+
+    if args.command == "mirror":
+        handles = list(args.handles)
+        if args.from_file:
+            with open(args.from_file) as f:
+                handles.extend(f.read().splitlines())
+        with metrics.instrumented(args):
+            asyncio.run(mirror(handles))
+    else:
+        serve(args.port)
+
+
+if __name__ == "__main__":
+    main()
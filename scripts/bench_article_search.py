@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Article Search Benchmark
+Builds a synthetic DTC/TSB/procedure corpus in a scratch database and measures
+query latency of ArticleSearchIndex.search (unfiltered, by bucket, by vehicle).
+A sample of the queries is also checked against a brute-force ranking that
+scores every match and filters through the relational tables, so a faster
+search that drops or misorders results fails the run.
+
+Usage:
+    python bench_article_search.py                   # 1,000,000 documents
+    python bench_article_search.py --docs 100000 --queries 2000 --verify 100
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from article_search import DEFAULT_LIMIT, ID_MASK, LENGTH_SHIFT, ArticleSearchIndex, idf, query_terms, term_score
+from article_store import init_article_tables
+from populate_db import create_indexes, create_schema
+
+# Configuration
+TARGET_P99_MS = 10.0
+ARTICLES_PER_VEHICLE = 60
+BODY_WORDS = 80
+VOCAB_SIZE = 50000
+ZIPF_EXPONENT = 1.0
+INSERT_BATCH = 10000
+
+BUCKETS = [
+    "Diagnostic Trouble Codes",
+    "Technical Service Bulletins",
+    "Interior Panel Replacement Procedures",
+    "Starter & Alternator Replacement Procedures",
+]
+WORDS = (
+    "engine misfire cylinder ignition coil spark plug fuel injector pressure sensor oxygen "
+    "catalyst converter intake manifold leak vacuum throttle body idle rough stall noise "
+    "vibration brake pedal rotor caliper pad abs module wheel speed steering rack pump "
+    "transmission shift harsh slip torque converter solenoid valve body fluid leak water "
+    "trunk rain seal door window regulator motor switch harness connector ground short "
+    "circuit open voltage battery alternator starter charging airbag deployment clock "
+    "spring seat belt pretensioner coolant thermostat radiator fan overheating heater core "
+    "compressor clutch refrigerant blend door actuator camshaft crankshaft timing chain "
+    "tensioner oil pressure sludge gasket cover replacement inspect replace remove install"
+).split()
+
+
+def build_vocabulary():
+    """Zipf-distributed vocabulary with the automotive terms spread over realistic ranks.
+
+    The first ranks are filler (stop-word-like) tokens that queries never use; the
+    automotive terms sit between rank 20 and ~2500, the way domain words do in real
+    article text.
+    """
+    vocab = [f"w{i}" for i in range(VOCAB_SIZE)]
+    for i, word in enumerate(WORDS):
+        vocab[20 + i * 15] = word
+    weights, total = [], 0.0
+    for rank in range(1, VOCAB_SIZE + 1):
+        total += 1.0 / rank ** ZIPF_EXPONENT
+        weights.append(total)
+    return vocab, weights
+
+
+def synthetic_text(rng, vocab, words):
+    return " ".join(rng.choices(vocab[0], cum_weights=vocab[1], k=words))
+
+
+def dtc_code(rng):
+    return f"{rng.choice('PBCU')}{rng.randint(0, 3999):04d}"
+
+
+def build_corpus(conn, docs, seed):
+    """Fill a scratch database with docs articles and their vehicle mappings."""
+    rng = random.Random(seed)
+    vocab = build_vocabulary()
+    c = conn.cursor()
+    create_schema(c)
+    create_indexes(conn)
+    init_article_tables(conn)
+    index = ArticleSearchIndex(conn)
+
+    vehicles = max(docs // ARTICLES_PER_VEHICLE, 1)
+    c.executemany("INSERT INTO models (id, vehicle_id, name, year, make_id) VALUES (?, ?, ?, ?, ?)",
+                  [(i, f"{100000 + i}:{i % 50000}", f"Model {i}", 2000 + i % 25, i % 60) for i in range(1, vehicles + 1)])
+
+    start = time.perf_counter()
+    for lo in range(0, docs, INSERT_BATCH):
+        articles, documents, mappings = [], [], []
+        for doc_id in range(lo + 1, min(lo + INSERT_BATCH, docs) + 1):
+            bucket = BUCKETS[doc_id % len(BUCKETS)]
+            code = dtc_code(rng) if bucket == BUCKETS[0] else None
+            title = synthetic_text(rng, vocab, 6)
+            article_id = f"A:{doc_id}"
+            articles.append((article_id, bucket, title, None, code, None))
+            # Shared articles: each maps to a few vehicles, as real TSBs and DTCs do
+            model_ids = sorted({rng.randint(1, vehicles) for _ in range(3)})
+            mappings.extend((model_id, article_id) for model_id in model_ids)
+            documents.append((article_id, bucket, None, code, title, synthetic_text(rng, vocab, BODY_WORDS), model_ids))
+        c.executemany("INSERT INTO articles VALUES (?, ?, ?, ?, ?, ?)", articles)
+        c.executemany("INSERT INTO vehicle_articles (model_id, article_id) VALUES (?, ?)", mappings)
+        index.index_documents(documents)
+    index.optimize()
+    print(f"Built {docs} documents for {vehicles} vehicles in {time.perf_counter() - start:.1f}s")
+    return index, vehicles
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+def reference_scores(conn, text, vehicle_id=None, bucket=None, limit=DEFAULT_LIMIT):
+    """Top scores from scoring every match, with no pruning and no maintained statistics.
+
+    Each term's posting lists are listed through fts5vocab, filters are plain SQL joins,
+    and document counts and lengths are recomputed from article_index_docs.
+    """
+    conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS temp.bench_vocab USING fts5vocab(main, article_index_terms, row)")
+    total_docs, avg_length = conn.execute("SELECT COUNT(*), AVG(length) FROM article_index_docs").fetchone()
+    sql = f'''
+        SELECT f.rowid FROM article_index_terms f
+        JOIN article_index_docs d ON d.id = (f.rowid & {ID_MASK})
+        WHERE article_index_terms MATCH ?
+    '''
+    params = []
+    if bucket:
+        sql += " AND d.bucket = ?"
+        params.append(bucket)
+    if vehicle_id:
+        sql += ''' AND d.article_id IN (SELECT va.article_id FROM vehicle_articles va
+                                        JOIN models m ON m.id = va.model_id WHERE m.vehicle_id = ?)'''
+        params.append(vehicle_id)
+
+    weights, postings = [], []
+    for term in query_terms(text):
+        # A term's tokens are term_<frequency>; '`' sorts right after '_'
+        tokens = [token for (token,) in conn.execute(
+            "SELECT term FROM temp.bench_vocab WHERE term > ? AND term < ?", (term + "_", term + "`"))
+            if token[len(term) + 1:].isdigit()]
+        df = sum(conn.execute("SELECT COUNT(*) FROM article_index_terms WHERE article_index_terms MATCH ?",
+                              (f'"{token}"',)).fetchone()[0] for token in tokens)
+        weights.append(idf(total_docs, df))
+        postings.append({rowid: int(token.rsplit("_", 1)[1]) for token in tokens
+                         for (rowid,) in conn.execute(sql, [f'"{token}"'] + params)})
+    rowids = set(postings[0]).intersection(*postings[1:]) if postings else set()
+    scores = sorted((sum(w * term_score(p[rowid], rowid >> LENGTH_SHIFT, avg_length)
+                         for w, p in zip(weights, postings)) for rowid in rowids), reverse=True)
+    return [round(score, 4) for score in scores[:limit]]
+
+
+def run_queries(index, vehicles, queries, seed, verify):
+    """Time each case; the first `verify` queries of each are also checked for correct top-k.
+
+    Returns ({case: timings}, [mismatched queries]).
+    """
+    rng = random.Random(seed + 1)
+    cases = {
+        "code": lambda: (dtc_code(rng), {}),
+        "symptom": lambda: (" ".join(rng.sample(WORDS, 2)), {}),
+        "symptom+bucket": lambda: (rng.choice(WORDS), {"bucket": rng.choice(BUCKETS)}),
+        "symptom+vehicle": lambda: (rng.choice(WORDS),
+                                    {"vehicle_id": f"{100000 + (v := rng.randint(1, vehicles))}:{v % 50000}"}),
+    }
+    results, mismatches = {}, []
+    for name, make_case in cases.items():
+        timings = []
+        for i in range(queries):
+            text, kwargs = make_case()
+            start = time.perf_counter()
+            found = index.search(text, **kwargs)
+            timings.append((time.perf_counter() - start) * 1000)
+            # Compare scores rather than ids so ties may come back in either order
+            if i < verify and [r["score"] for r in found] != reference_scores(index.conn, text, **kwargs):
+                mismatches.append((name, text, kwargs))
+        results[name] = timings
+    return results, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark local article search")
+    parser.add_argument("--docs", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=1000, help="Queries per case")
+    parser.add_argument("--verify", type=int, default=50, help="Queries per case checked against a brute-force ranking")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", help="Scratch database path (default: temporary file)")
+    args = parser.parse_args()
+
+    db_file = args.db or os.path.join(tempfile.mkdtemp(), "search_bench.db")
+    conn = sqlite3.connect(db_file)
+    try:
+        index, vehicles = build_corpus(conn, args.docs, args.seed)
+        results, mismatches = run_queries(index, vehicles, args.queries, args.seed, args.verify)
+    finally:
+        conn.close()
+        if not args.db:
+            os.remove(db_file)
+
+    print(f"\n{'case':18} {'p50':>8} {'p95':>8} {'p99':>8} {'mean':>8}  (ms)")
+    worst = 0.0
+    for name, timings in results.items():
+        p99 = percentile(timings, 99)
+        worst = max(worst, p99)
+        print(f"{name:18} {percentile(timings, 50):8.2f} {percentile(timings, 95):8.2f} "
+              f"{p99:8.2f} {statistics.mean(timings):8.2f}")
+    status = "✅" if worst <= TARGET_P99_MS else "❌"
+    print(f"\n{status} worst p99 {worst:.2f} ms (target {TARGET_P99_MS:.0f} ms)")
+    checked = min(args.verify, args.queries) * len(results)
+    if mismatches:
+        print(f"❌ {len(mismatches)}/{checked} verified queries returned the wrong top {DEFAULT_LIMIT}:")
+        for name, text, kwargs in mismatches[:10]:
+            print(f"    {name}: {text!r} {kwargs}")
+    elif checked:
+        print(f"✅ {checked} verified queries match the brute-force ranking")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Bulk Content Fetch
+Streams per-vehicle content from the proxy for any number of
+(vehicleId, contentType) pairs. Results are yielded as they complete, with
+bounded concurrency and a bounded result buffer: when the consumer falls
+behind, fetching pauses, so memory stays constant however many pairs are fed
+in. A failed request comes back as a result carrying an error rather than
+aborting the batch.
+
+Usage:
+    python bulk_fetch.py 188569:13820 --content dtcs tsbs specs
+    python bulk_fetch.py --all-vehicles --content fluids --out fluids.jsonl
+
+    # From code
+    async for result in fetch_content(session, pairs):
+        if result.ok:
+            write(result.vehicle_id, result.content_type, result.body)
+"""
+
+import argparse
+import asyncio
+import json
+import sqlite3
+import sys
+from dataclasses import dataclass
+from typing import Any, Iterable, Optional, Tuple
+from urllib.parse import quote
+
+import aiohttp
+from tqdm.asyncio import tqdm
+
+import metrics
+from populate_db import BASE_URL, CONCURRENT_REQUESTS, DB_FILE, fetch_json_result
+
+# Configuration
+CONTENT_SOURCE = "MOTOR"
+BUFFER_SIZE = 100  # Completed results held for the consumer before fetching pauses
+
+# Per-vehicle content routes on the proxy (source/{source}/vehicle/{vehicleId}/...)
+CONTENT_TYPES = [
+    "articles/v2", "categories", "dtcs", "tsbs", "procedures", "diagrams", "wiring", "components",
+    "specs", "fluids", "labor", "labor-times", "parts", "part-vectors", "brake-service", "ac-heater",
+    "tpms", "relearn", "lamp-reset", "battery", "steering-suspension", "airbag",
+    "maintenanceSchedules/frequency", "maintenanceSchedules/indicators",
+]
+
+
+@dataclass
+class ContentResult:
+    vehicle_id: str
+    content_type: str
+    body: Any = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def content_url(vehicle_id, content_type):
+    return f"{BASE_URL}/source/{CONTENT_SOURCE}/vehicle/{quote(vehicle_id, safe='')}/{content_type}"
+
+
+async def fetch_one(session, vehicle_id, content_type):
+    """Fetch a single pair, turning any failure into an error result."""
+    body, error = await fetch_json_result(session, content_url(vehicle_id, content_type))
+    return ContentResult(vehicle_id, content_type, body, error)
+
+
+async def fetch_content(session, pairs: Iterable[Tuple[str, str]],
+                        concurrency=CONCURRENT_REQUESTS, buffer=BUFFER_SIZE):
+    """Yield a ContentResult per (vehicle_id, content_type) pair, in completion order.
+
+    pairs is consumed lazily, so it can be a generator over millions of rows. At most
+    `concurrency` requests are in flight and at most `buffer` results wait for the
+    consumer; beyond that the workers block instead of pulling more pairs. Breaking
+    out of the loop cancels the outstanding requests.
+    """
+    pairs = iter(pairs)
+    queue = asyncio.Queue(maxsize=buffer)
+    done = object()
+
+    async def worker():
+        try:
+            # Workers share one iterator; each pulls its next pair only after handing
+            # its previous result to the queue
+            for vehicle_id, content_type in pairs:
+                await queue.put(await fetch_one(session, vehicle_id, content_type))
+                metrics.QUEUE_DEPTH.set(queue.qsize(), queue="bulk_fetch")
+        except Exception as e:
+            # A broken input iterable is a caller bug, not a per-item failure
+            await queue.put(e)
+        await queue.put(done)
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        remaining = len(workers)
+        while remaining:
+            item = await queue.get()
+            metrics.QUEUE_DEPTH.set(queue.qsize(), queue="bulk_fetch")
+            if item is done:
+                remaining -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield item
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+def vehicle_ids_from_db(db_file=DB_FILE):
+    """Lazily iterate every vehicleId in vehicles.db."""
+    conn = sqlite3.connect(db_file)
+    try:
+        for (vehicle_id,) in conn.execute("SELECT vehicle_id FROM models ORDER BY id"):
+            yield vehicle_id
+    finally:
+        conn.close()
+
+
+async def run(vehicle_ids, content_types, total, out):
+    timeout = aiohttp.ClientTimeout(total=30)
+    connector = aiohttp.TCPConnector(ssl=False)
+    failed = 0
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector, headers={"User-Agent": "VehicleDBPopulator/1.0"}) as session:
+        pairs = ((vehicle_id, content_type) for vehicle_id in vehicle_ids for content_type in content_types)
+        async for result in tqdm(fetch_content(session, pairs), total=total, desc="Fetching Content"):
+            if not result.ok:
+                failed += 1
+            out.write(json.dumps({"vehicleId": result.vehicle_id, "contentType": result.content_type,
+                                  "body": result.body, "error": result.error}) + "\n")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream per-vehicle content from the proxy as JSON lines")
+    parser.add_argument("vehicle_ids", nargs="*", help="vehicleIds, e.g. 188569:13820")
+    parser.add_argument("--all-vehicles", action="store_true", help="Every vehicle in vehicles.db")
+    parser.add_argument("--content", nargs="+", default=CONTENT_TYPES, choices=CONTENT_TYPES, metavar="TYPE",
+                        help="Content types to fetch (default: all)")
+    parser.add_argument("--out", help="Output file (default: stdout)")
+    metrics.add_arguments(parser, "bulk_fetch")
+    args = parser.parse_args()
+
+    if args.all_vehicles:
+        conn = sqlite3.connect(DB_FILE)
+        count = conn.execute("SELECT COUNT(*) FROM models").fetchone()[0]
+        conn.close()
+        vehicle_ids = vehicle_ids_from_db()
+    elif args.vehicle_ids:
+        count = len(args.vehicle_ids)
+        vehicle_ids = args.vehicle_ids
+    else:
+        parser.error("give vehicleIds or --all-vehicles")
+
+    out = open(args.out, "w") if args.out else sys.stdout
+    try:
+        with metrics.instrumented(args):
+            failed = asyncio.run(run(vehicle_ids, args.content, count * len(args.content), out))
+    finally:
+        if args.out:
+            out.close()
+    status = "✅" if not failed else "⚠️"
+    print(f"\n{status} Fetched {count * len(args.content) - failed} items, {failed} failed", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Bundle Export
+Builds vehicle bundles (see vehicle_bundle.py) from the proxy routes, the
+article store and the asset mirror. Kept apart from the bundle format so
+reading and serving a bundle needs only the standard library; this module
+pulls in the crawl stack (aiohttp, bulk_fetch, populate_db, ...).
+
+Usage:
+    python vehicle_bundle.py export 188569:13820                 # -> 188569_13820.bundle
+"""
+
+import asyncio
+import html
+import json
+import os
+import re
+import sqlite3
+
+import aiohttp
+
+from article_store import ArticleStore
+from asset_mirror import blob_path, handle_key, init_asset_tables, is_asset_handle, mirror_asset
+from bulk_fetch import CONTENT_SOURCE, CONTENT_TYPES, fetch_content
+from populate_db import CONCURRENT_REQUESTS, DB_FILE
+from vehicle_bundle import BundleWriter, VehicleBundle, article_key
+
+# Graphic and asset handles referenced from article HTML or route JSON, with any
+# resize query (&amp;-escaped in HTML); handle_key() keeps only w/h
+HANDLE_RE = re.compile(r'(?:asset/[\w.-]+|(?:source|manufacturer)/[\w.-]+/graphic/[\w.-]+(?:\?[\w=&;.%-]*)?)')
+
+
+def referenced_handles(text):
+    return {handle_key(html.unescape(match)) for match in HANDLE_RE.findall(text)}
+
+
+def vehicle_route(vehicle_id, route):
+    return f"source/{CONTENT_SOURCE}/vehicle/{vehicle_id}/{route}"
+
+
+async def export(vehicle_id, out_path, db_file=DB_FILE):
+    """Write a bundle for vehicle_id from the proxy routes and the local stores."""
+    conn = sqlite3.connect(db_file, check_same_thread=False)
+    init_asset_tables(conn)
+    store = ArticleStore(conn)
+    writer = BundleWriter(out_path, vehicle_id)
+    handles = set()
+    failed = []
+
+    timeout = aiohttp.ClientTimeout(total=120)
+    connector = aiohttp.TCPConnector(ssl=False)
+    try:
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector, headers={"User-Agent": "VehicleDBPopulator/1.0"}) as session:
+            async for result in fetch_content(session, ((vehicle_id, route) for route in CONTENT_TYPES)):
+                if not result.ok:
+                    failed.append(f"{result.content_type} ({result.error})")
+                    continue
+                writer.add_json(vehicle_route(vehicle_id, result.content_type), result.body)
+                handles.update(referenced_handles(json.dumps(result.body)))
+
+            # Article bodies come from the local store (see article_store.py crawl)
+            articles = conn.execute('''
+                SELECT va.article_id FROM vehicle_articles va
+                JOIN models m ON m.id = va.model_id
+                WHERE m.vehicle_id = ?
+            ''', (vehicle_id,)).fetchall()
+            for (article_id,) in articles:
+                stored = store.get(article_id)
+                if not stored:
+                    continue
+                content_type, data = stored
+                writer.add(article_key(CONTENT_SOURCE, vehicle_id, article_id), data, content_type or "text/html")
+                handles.update(referenced_handles(data.decode("utf-8", errors="replace")))
+
+            # Referenced graphics, mirroring any that are not in the asset store yet
+            semaphore = asyncio.Semaphore(CONCURRENT_REQUESTS)
+            handles = sorted(h for h in handles if is_asset_handle(h))
+            digests = await asyncio.gather(*(mirror_asset(session, conn, h, semaphore) for h in handles))
+            for handle, digest in zip(handles, digests):
+                if not digest:
+                    failed.append(handle)
+                    continue
+                content_type = conn.execute("SELECT content_type FROM asset_blobs WHERE hash = ?",
+                                            (digest,)).fetchone()[0]
+                with open(blob_path(digest), "rb") as f:
+                    writer.add(handle, f.read(), content_type or "application/octet-stream")
+        writer.close()
+        # Read every entry back before handing the bundle out
+        with VehicleBundle(out_path) as bundle:
+            problems = bundle.verify()
+    finally:
+        if os.path.exists(writer.tmp_path):
+            writer.f.close()
+            os.remove(writer.tmp_path)
+        conn.close()
+
+    size = os.path.getsize(out_path)
+    print(f"\n✅ Wrote {len(writer.entries)} items ({len(articles)} articles listed, {len(handles)} graphics) "
+          f"to '{out_path}' ({size} bytes)")
+    for item in failed:
+        print(f"⚠️ Not included: {item}")
+    for key, problem in problems:
+        print(f"❌ {key}: {problem}")
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Maintenance Schedule Precompute
+Pulls the frequency, intervals and indicators schedules for every vehicle in
+vehicles.db and stores them as per-vehicle sorted mileage arrays, so
+"what's due at X miles" is answered locally with a bisect lookup.
+
+Usage:
+    python maintenance_schedule.py precompute                  # All vehicles in vehicles.db
+    python maintenance_schedule.py precompute --vehicle 188569:13820
+    python maintenance_schedule.py precompute --rediscover     # Probe intervalType values again
+    python maintenance_schedule.py due 188569:13820 30000      # Due at / next due after 30,000 mi
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import re
+import sqlite3
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from urllib.parse import quote, urlencode
+
+import aiohttp
+from tqdm.asyncio import tqdm
+
+import metrics
+from populate_db import BASE_URL, CONCURRENT_REQUESTS, DB_FILE, fetch_json, init_db
+
+# Configuration
+CONTENT_SOURCE = "MOTOR"
+MAX_MILEAGE = 150000   # Recurring schedules are expanded up to this mileage
+INTERVAL_STEP = 5000   # Grid probed when the frequency schedule cannot be parsed
+PROBE_INTERVAL = 30000
+TIMELINE_CACHE_SIZE = 1024  # Vehicles whose schedules a MaintenanceTimeline keeps in memory
+# Candidates probed when discovering which intervalType values the API accepts
+INTERVAL_TYPE_CANDIDATES = ["miles", "Miles", "Distance", "Kilometers", "months", "Month", "Months"]
+
+MILES_RE = re.compile(r'([\d,]+)\s*(?:miles|mi\b)', re.IGNORECASE)
+
+
+def init_maintenance_tables(conn):
+    """Create the maintenance tables in the vehicles database."""
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS maintenance_interval_types (
+            interval_type TEXT PRIMARY KEY
+        ) WITHOUT ROWID
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS maintenance_vehicles (
+            model_id INTEGER PRIMARY KEY, -- models.id
+            indicators TEXT, -- raw indicators body (JSON)
+            fetched_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS maintenance_intervals (
+            model_id INTEGER NOT NULL,
+            mileage INTEGER NOT NULL,
+            items TEXT NOT NULL, -- JSON list of {name, severity}
+            PRIMARY KEY (model_id, mileage)
+        ) WITHOUT ROWID
+    ''')
+    conn.commit()
+
+
+def schedule_url(vehicle_id, kind, **params):
+    """Build a proxy URL for one of the maintenanceSchedules endpoints."""
+    url = f"{BASE_URL}/source/{CONTENT_SOURCE}/vehicle/{quote(vehicle_id, safe='')}/maintenanceSchedules/{kind}"
+    if params:
+        url += "?" + urlencode(params)
+    return url
+
+
+async def discover_interval_types(session, conn, vehicle_id, semaphore, rediscover=False):
+    """Return the accepted intervalType values, probing the API until a distance type is found.
+
+    Results are cached only once a distance type has been accepted, so a transient
+    failure during the probe is retried on the next run instead of being remembered.
+    """
+    if rediscover:
+        conn.execute('DELETE FROM maintenance_interval_types')
+        conn.commit()
+    cached = [row[0] for row in conn.execute('SELECT interval_type FROM maintenance_interval_types')]
+    if cached:
+        return cached
+
+    print(f"Discovering valid intervalType values using {vehicle_id}...")
+    valid = []
+    for interval_type in INTERVAL_TYPE_CANDIDATES:
+        url = schedule_url(vehicle_id, "intervals", intervalType=interval_type, interval=PROBE_INTERVAL)
+        async with semaphore:
+            body = await fetch_json(session, url)
+        if body is not None:
+            valid.append(interval_type)
+
+    logging.info(f"Valid intervalType values: {valid}")
+    if not mileage_interval_type(valid):
+        return valid
+    conn.executemany("INSERT OR IGNORE INTO maintenance_interval_types (interval_type) VALUES (?)",
+                     [(t,) for t in valid])
+    conn.commit()
+    return valid
+
+
+def mileage_interval_type(interval_types):
+    """Pick the distance-based intervalType from the discovered values."""
+    for interval_type in interval_types:
+        if interval_type.lower() in ("miles", "distance"):
+            return interval_type
+    return None
+
+
+def parse_frequency_miles(text):
+    """Extract the mileage from a frequency like 'Every 5,000 miles or 6 months'."""
+    match = MILES_RE.search(text or "")
+    if not match:
+        return None
+    miles = int(match.group(1).replace(",", ""))
+    return miles or None
+
+
+def schedule_item(item):
+    return {"name": item.get("name"), "severity": item.get("severity")}
+
+
+def normalize_schedule(frequency_body, interval_bodies):
+    """Merge frequency and interval responses into a sorted [(mileage, items)] list."""
+    by_mileage = {}
+
+    def add(mileage, item):
+        items = by_mileage.setdefault(mileage, [])
+        if item not in items:
+            items.append(item)
+
+    frequencies = (frequency_body or {}).get("frequencies", []) if isinstance(frequency_body, dict) else []
+    for frequency in frequencies:
+        every = parse_frequency_miles(frequency.get("frequency"))
+        if not every:
+            continue
+        for mileage in range(every, MAX_MILEAGE + 1, every):
+            for item in frequency.get("items", []):
+                add(mileage, schedule_item(item))
+
+    for body in interval_bodies:
+        if not isinstance(body, dict) or not body.get("interval"):
+            continue
+        for item in body.get("items", []):
+            add(int(body["interval"]), schedule_item(item))
+
+    return sorted(by_mileage.items())
+
+
+async def precompute_vehicle(session, conn, model_id, vehicle_id, interval_type, semaphore):
+    """Fetch and store the normalized schedule for a single vehicle."""
+    async with semaphore:
+        frequency_body = await fetch_json(session, schedule_url(vehicle_id, "frequency"))
+    async with semaphore:
+        indicators_body = await fetch_json(session, schedule_url(vehicle_id, "indicators"))
+
+    interval_bodies = []
+    if interval_type:
+        # Ask for the points the frequency schedule implies; fall back to a fixed grid
+        points = [m for m, _ in normalize_schedule(frequency_body, [])]
+        if not points:
+            points = list(range(INTERVAL_STEP, MAX_MILEAGE + 1, INTERVAL_STEP))
+
+        async def fetch_interval(mileage):
+            async with semaphore:
+                return await fetch_json(session, schedule_url(vehicle_id, "intervals",
+                                                              intervalType=interval_type, interval=mileage))
+
+        interval_bodies = await asyncio.gather(*(fetch_interval(m) for m in points))
+
+    if frequency_body is None and not any(interval_bodies):
+        logging.warning(f"No maintenance schedule for {vehicle_id}")
+        return
+
+    schedule = normalize_schedule(frequency_body, interval_bodies)
+    try:
+        c = conn.cursor()
+        c.execute("DELETE FROM maintenance_intervals WHERE model_id = ?", (model_id,))
+        with metrics.db_write("maintenance_intervals", len(schedule)):
+            c.executemany(
+                "INSERT INTO maintenance_intervals (model_id, mileage, items) VALUES (?, ?, ?)",
+                [(model_id, mileage, json.dumps(items)) for mileage, items in schedule]
+            )
+        with metrics.db_write("maintenance_vehicles", 1):
+            c.execute(
+                "INSERT OR REPLACE INTO maintenance_vehicles (model_id, indicators) VALUES (?, ?)",
+                (model_id, json.dumps(indicators_body))
+            )
+        metrics.commit(conn)
+    except sqlite3.Error as e:
+        logging.error(f"Database error for maintenance {vehicle_id}: {e}")
+
+
+async def precompute(vehicle_ids=None, refresh=False, rediscover=False):
+    """Precompute schedules for the given vehicleIds (default: all models not yet done)."""
+    conn = init_db()
+    init_maintenance_tables(conn)
+
+    query = '''
+        SELECT m.id, m.vehicle_id FROM models m
+        LEFT JOIN maintenance_vehicles mv ON mv.model_id = m.id
+    '''
+    if not refresh:
+        query += ' WHERE mv.model_id IS NULL'
+    vehicles = conn.execute(query).fetchall()
+    if vehicle_ids:
+        wanted = set(vehicle_ids)
+        vehicles = [v for v in vehicles if v[1] in wanted]
+    if not vehicles:
+        print("Nothing to precompute.")
+        return
+
+    timeout = aiohttp.ClientTimeout(total=30)
+    connector = aiohttp.TCPConnector(ssl=False)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector, headers={"User-Agent": "VehicleDBPopulator/1.0"}) as session:
+        semaphore = metrics.TrackedSemaphore(CONCURRENT_REQUESTS, "maintenance")
+        interval_types = await discover_interval_types(session, conn, vehicles[0][1], semaphore, rediscover)
+        interval_type = mileage_interval_type(interval_types)
+        if not interval_type:
+            print("⚠️ No distance intervalType accepted; using frequency schedules only.")
+
+        tasks = [precompute_vehicle(session, conn, model_id, vehicle_id, interval_type, semaphore)
+                 for model_id, vehicle_id in vehicles]
+        for f in tqdm.as_completed(tasks, total=len(tasks), desc="Maintenance Schedules"):
+            await f
+
+    conn.close()
+    print(f"\n✅ Maintenance schedules stored for {len(vehicles)} vehicles in '{DB_FILE}'")
+
+
+class MaintenanceTimeline:
+    """Local "due at mileage" lookups over the precomputed schedules."""
+
+    def __init__(self, db_file=DB_FILE, cache_size=TIMELINE_CACHE_SIZE):
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.cache_size = cache_size
+        self._schedules = OrderedDict()
+
+    def invalidate(self, vehicle_id=None):
+        """Drop cached schedules (one vehicle, or all) so the next lookup rereads the database,
+        e.g. after precompute --refresh."""
+        if vehicle_id is None:
+            self._schedules.clear()
+        else:
+            self._schedules.pop(vehicle_id, None)
+
+    def close(self):
+        self._schedules.clear()
+        self.conn.close()
+
+    def _schedule(self, vehicle_id):
+        """Return (mileages, items) arrays for a vehicle, sorted by mileage."""
+        schedule = self._schedules.get(vehicle_id)
+        if schedule is not None:
+            self._schedules.move_to_end(vehicle_id)
+            return schedule
+        rows = self.conn.execute('''
+            SELECT mi.mileage, mi.items FROM maintenance_intervals mi
+            JOIN models m ON m.id = mi.model_id
+            WHERE m.vehicle_id = ?
+            ORDER BY mi.mileage
+        ''', (vehicle_id,)).fetchall()
+        schedule = self._schedules[vehicle_id] = [r[0] for r in rows], [json.loads(r[1]) for r in rows]
+        if len(self._schedules) > self.cache_size:
+            self._schedules.popitem(last=False)
+        return schedule
+
+    def due_at(self, vehicle_id, mileage):
+        """Return the most recent service point at or below mileage as {mileage, items}."""
+        mileages, items = self._schedule(vehicle_id)
+        i = bisect_right(mileages, mileage)
+        if i == 0:
+            return None
+        return {"mileage": mileages[i - 1], "items": items[i - 1]}
+
+    def next_due(self, vehicle_id, mileage):
+        """Return the first service point strictly after mileage as {mileage, items}."""
+        mileages, items = self._schedule(vehicle_id)
+        i = bisect_right(mileages, mileage)
+        if i == len(mileages):
+            return None
+        return {"mileage": mileages[i], "items": items[i]}
+
+    def due_between(self, vehicle_id, start, end):
+        """Return every service point with start <= mileage <= end."""
+        mileages, items = self._schedule(vehicle_id)
+        lo, hi = bisect_left(mileages, start), bisect_right(mileages, end)
+        return [{"mileage": mileages[i], "items": items[i]} for i in range(lo, hi)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintenance schedule precompute and lookup")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    pre = sub.add_parser("precompute", help="Fetch and store schedules")
+    pre.add_argument("--vehicle", action="append", help="Only this vehicleId (repeatable)")
+    pre.add_argument("--refresh", action="store_true", help="Refetch vehicles already stored")
+    pre.add_argument("--rediscover", action="store_true", help="Probe the accepted intervalType values again")
+    metrics.add_arguments(pre, "maintenance_schedule")
+
+    due = sub.add_parser("due", help="Show what is due at a mileage")
+    due.add_argument("vehicle_id")
+    due.add_argument("mileage", type=int)
+    args = parser.parse_args()
+
+    if args.command == "precompute":
+        with metrics.instrumented(args):
+            asyncio.run(precompute(args.vehicle, refresh=args.refresh, rediscover=args.rediscover))
+    else:
+        timeline = MaintenanceTimeline()
+        print(json.dumps({
+            "dueAt": timeline.due_at(args.vehicle_id, args.mileage),
+            "nextDue": timeline.next_due(args.vehicle_id, args.mileage),
+        }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+"""
+Crawler Metrics
+Prometheus-style metrics for the crawl scripts, with no extra dependencies:
+HTTP request counts, latency and in-flight requests per endpoint, cache
+hits, semaphore queue depths and database write throughput. Export them
+over HTTP for a Prometheus scrape, or to a textfile for node_exporter's
+textfile collector (or just for reading after a run). profiling() wraps a
+run in cProfile and tracemalloc.
+
+Usage:
+    python populate_db.py --metrics-port 9108                # http://localhost:9108/metrics
+    python populate_db.py --metrics-file crawl.prom --profile crawl
+    python article_store.py crawl --metrics-file articles.prom
+
+    # From a script's CLI
+    metrics.add_arguments(parser, "article_store")
+    args = parser.parse_args()
+    with metrics.instrumented(args):
+        asyncio.run(crawl())
+
+    # From code
+    with metrics.track_request(url) as outcome:
+        ...
+        outcome["status"] = response.status
+"""
+
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import re
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+# Configuration
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DB_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+RATE_WINDOW = 60          # Seconds averaged by rows-per-second gauges
+TEXTFILE_INTERVAL = 15    # Seconds between textfile rewrites
+PROFILE_TOP = 40          # Rows in the profile summaries
+
+# Path segments following these are identifiers and become {id} in endpoint labels
+ID_PARENTS = {"year", "years", "make", "makes", "models", "engines", "vehicle", "article", "xml", "dtc", "tsb",
+              "labor", "graphic", "asset", "mileage", "miles"}
+ID_RE = re.compile(r'^[\d:._-]+$')
+
+_lock = threading.Lock()
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _label_text(self, key, extra=()):
+        pairs = list(zip(self.labels, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name + self._label_text(key), value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name} {value}" for name, value in self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with _lock:
+            self.values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        for key, (counts, total, count) in self.values.items():
+            for bound, bucket_count in zip(self.buckets, counts):
+                yield self.name + "_bucket" + self._label_text(key, [("le", f"{bound:g}")]), bucket_count
+            yield self.name + "_bucket" + self._label_text(key, [("le", "+Inf")]), count
+            yield self.name + "_sum" + self._label_text(key), total
+            yield self.name + "_count" + self._label_text(key), count
+
+
+class RateGauge(Metric):
+    """Events per second over the last RATE_WINDOW seconds, for readers without PromQL rate().
+
+    Events are summed into one-second buckets and old buckets are dropped as new
+    ones arrive, so memory stays bounded whether or not anything reads the gauge.
+    """
+
+    kind = "gauge"
+
+    def mark(self, amount=1, **labels):
+        key = self._key(labels)
+        second = int(time.monotonic())
+        with _lock:
+            buckets = self.values.setdefault(key, deque())
+            if buckets and buckets[-1][0] == second:
+                buckets[-1][1] += amount
+            else:
+                buckets.append([second, amount])
+            self._prune(buckets, second)
+
+    @staticmethod
+    def _prune(buckets, now):
+        while buckets and buckets[0][0] <= now - RATE_WINDOW:
+            buckets.popleft()
+
+    def samples(self):
+        now = int(time.monotonic())
+        for key, buckets in self.values.items():
+            self._prune(buckets, now)
+            yield self.name + self._label_text(key), sum(amount for _, amount in buckets) / RATE_WINDOW
+
+
+HTTP_REQUESTS = Counter("motor_http_requests_total", "Proxy requests by endpoint and HTTP status (or error kind).",
+                        ["endpoint", "status"])
+HTTP_LATENCY = Histogram("motor_http_request_duration_seconds", "Proxy request latency by endpoint.", ["endpoint"])
+HTTP_IN_FLIGHT = Gauge("motor_http_in_flight_requests", "Proxy requests currently in flight.", ["endpoint"])
+CACHE_LOOKUPS = Counter("motor_cache_lookups_total", "Local store lookups that avoided (hit) or needed (miss) a request.",
+                        ["cache", "result"])
+QUEUE_DEPTH = Gauge("motor_queue_depth", "Tasks waiting for a request slot, or results waiting for a consumer.", ["queue"])
+DB_ROWS = Counter("motor_db_rows_written_total", "Rows written to vehicles.db by table.", ["table"])
+DB_ROWS_RATE = RateGauge("motor_db_rows_per_second", f"Rows written per second over the last {RATE_WINDOW}s.", ["table"])
+DB_WRITE_LATENCY = Histogram("motor_db_write_duration_seconds", "Time spent in batched inserts by table.", ["table"],
+                             buckets=DB_BUCKETS)
+DB_COMMIT_LATENCY = Histogram("motor_db_commit_duration_seconds", "Time spent committing.", buckets=DB_BUCKETS)
+
+
+def endpoint_label(url):
+    """Collapse a request URL to a low-cardinality route, e.g. year/{id}/make/{id}/models."""
+    path = urlsplit(url).path
+    path = path.rsplit("/api/", 1)[-1]
+    segments = [unquote(s) for s in path.strip("/").split("/")]
+    for i, segment in enumerate(segments):
+        if ID_RE.match(segment) or (i and segments[i - 1].lower() in ID_PARENTS):
+            segments[i] = "{id}"
+    return "/".join(segments)
+
+
+@contextmanager
+def track_request(url):
+    """Count and time one request. Set outcome["status"] to the HTTP status inside the block."""
+    endpoint = endpoint_label(url)
+    outcome = {"status": "error"}
+    HTTP_IN_FLIGHT.inc(endpoint=endpoint)
+    start = time.perf_counter()
+    try:
+        yield outcome
+    except asyncio.TimeoutError:
+        outcome["status"] = "timeout"
+        raise
+    finally:
+        HTTP_IN_FLIGHT.dec(endpoint=endpoint)
+        HTTP_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint)
+        HTTP_REQUESTS.inc(endpoint=endpoint, status=outcome["status"])
+
+
+@contextmanager
+def db_write(table, rows):
+    """Time a batched insert of `rows` rows into `table`."""
+    start = time.perf_counter()
+    yield
+    DB_WRITE_LATENCY.observe(time.perf_counter() - start, table=table)
+    DB_ROWS.inc(rows, table=table)
+    DB_ROWS_RATE.mark(rows, table=table)
+
+
+def commit(conn):
+    start = time.perf_counter()
+    conn.commit()
+    DB_COMMIT_LATENCY.observe(time.perf_counter() - start)
+
+
+class TrackedSemaphore(asyncio.Semaphore):
+    """asyncio.Semaphore that reports how many tasks are waiting for a slot."""
+
+    def __init__(self, value, name):
+        super().__init__(value)
+        self.name = name
+
+    async def acquire(self):
+        QUEUE_DEPTH.inc(queue=self.name)
+        try:
+            return await super().acquire()
+        finally:
+            QUEUE_DEPTH.dec(queue=self.name)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+def write_textfile(path):
+    """Atomically replace `path` with the current metrics."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        f.write(render())
+    os.replace(tmp_path, path)
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes every few seconds would flood stderr
+
+
+def start_http_server(port):
+    """Serve /metrics from a daemon thread."""
+    server = ThreadingHTTPServer(("", port), MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"📈 Metrics on http://localhost:{port}/metrics", file=sys.stderr)
+    return server
+
+
+@contextmanager
+def exporting(port=None, textfile=None, interval=TEXTFILE_INTERVAL):
+    """Export metrics for the duration of a run: a /metrics endpoint and/or a textfile
+    rewritten every `interval` seconds and once more at the end."""
+    server = start_http_server(port) if port else None
+    stop = threading.Event()
+    if textfile:
+        def rewrite():
+            while not stop.wait(interval):
+                write_textfile(textfile)
+        threading.Thread(target=rewrite, daemon=True).start()
+    try:
+        yield
+    finally:
+        stop.set()
+        if textfile:
+            write_textfile(textfile)
+            print(f"📈 Metrics written to '{textfile}'", file=sys.stderr)
+        if server:
+            server.shutdown()
+
+
+@contextmanager
+def profiling(prefix):
+    """Profile the block with cProfile and tracemalloc when prefix is set.
+
+    Writes <prefix>.prof (open with pstats or snakeviz), <prefix>.tracemalloc (a
+    tracemalloc snapshot) and <prefix>.txt (top functions by cumulative time, and
+    the allocations that grew most over the run).
+    """
+    if not prefix:
+        yield
+        return
+    tracemalloc.start(25)
+    baseline = tracemalloc.take_snapshot()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        profiler.dump_stats(f"{prefix}.prof")
+        snapshot.dump(f"{prefix}.tracemalloc")
+
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP)
+        out.write(f"\nAllocation growth over the run (top {PROFILE_TOP}):\n")
+        for stat in snapshot.compare_to(baseline, "lineno")[:PROFILE_TOP]:
+            out.write(f"{stat}\n")
+        with open(f"{prefix}.txt", "w") as f:
+            f.write(out.getvalue())
+        print(f"🔬 Profile written to '{prefix}.prof', '{prefix}.tracemalloc' and '{prefix}.txt'", file=sys.stderr)
+
+
+def add_arguments(parser, profile_prefix):
+    """Add the shared --metrics-port, --metrics-file and --profile options to a parser."""
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on this port")
+    parser.add_argument("--metrics-file", help="Write Prometheus metrics to this textfile during the run")
+    parser.add_argument("--profile", nargs="?", const=profile_prefix, metavar="PREFIX",
+                        help="Capture cProfile and tracemalloc output to PREFIX.prof/.tracemalloc/.txt")
+
+
+@contextmanager
+def instrumented(args):
+    """exporting() and profiling() as requested by add_arguments() options.
+
+    Commands whose parser did not get the options run uninstrumented.
+    """
+    with exporting(getattr(args, "metrics_port", None), getattr(args, "metrics_file", None)), \
+            profiling(getattr(args, "profile", None)):
+        yield
@@ -1,3 +1,4 @@
+import argparse
 import asyncio
 import aiohttp
 import sqlite3
@@ -5,10 +6,28 @@ import logging
 from tqdm.asyncio import tqdm
 from urllib.parse import quote
 
+import metrics
+
 # Configuration
 BASE_URL = "https://motorproxy-erohrfg7qa-uc.a.run.app/api/motor-proxy/api"
 DB_FILE = "vehicles.db"
 CONCURRENT_REQUESTS = 10  # Limit concurrency to avoid overwhelming the server
+BULK_CACHE_KIB = -262144  # 256 MiB page cache during bulk loads (negative = KiB)
+FLUIDS_PAGE_SIZE = 30  # Fluid applications per summary page (DaaS caps PageIndex pages at 30 items)
+
+SCHEMA_VERSION = 3
+
+# Secondary indexes, created up front in normal mode and after the load in bulk mode.
+# idx_models_ymm covers the year -> make -> model lookup path without touching the table.
+INDEXES = [
+    ('idx_years_status', 'CREATE INDEX IF NOT EXISTS idx_years_status ON years(status)'),
+    ('idx_models_vehicle_id', 'CREATE UNIQUE INDEX IF NOT EXISTS idx_models_vehicle_id ON models(vehicle_id)'),
+    ('idx_models_ymm', 'CREATE INDEX IF NOT EXISTS idx_models_ymm ON models(year, make_id, name, vehicle_id)'),
+    ('idx_chek_chart_years_status', 'CREATE INDEX IF NOT EXISTS idx_chek_chart_years_status ON chek_chart_years(status)'),
+    ('idx_chek_chart_vehicles_motor',
+     'CREATE INDEX IF NOT EXISTS idx_chek_chart_vehicles_motor ON chek_chart_vehicles(motor_model_id, base_vehicle_id, engine_id)'),
+    ('idx_fluid_vehicles_status', 'CREATE INDEX IF NOT EXISTS idx_fluid_vehicles_status ON fluid_vehicles(status)'),
+]
 
 # Logging setup
 logging.basicConfig(
@@ -17,89 +36,340 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-async def fetch_json(session, url):
-    """Fetch JSON from a URL with error handling."""
+async def fetch_json_result(session, url):
+    """Fetch JSON from a URL. Returns (body, error); error is None on success."""
     try:
-        async with session.get(url) as response:
-            if response.status == 200:
-                data = await response.json()
-                # Handle the API's specific response structure
-                if 'body' in data:
-                    return data['body']
-                return data
-            else:
-                error_message = f"Failed to fetch {url}: Status {response.status}"
-                try:
-                    # Attempt to read response body for more details
-                    response_text = await response.text()
-                    error_message += f", Response: {response_text[:500]}" # Log first 500 chars
-                except Exception as text_e:
-                    logging.warning(f"Could not read response text for {url}: {text_e}")
-                logging.error(error_message)
-                return None
+        with metrics.track_request(url) as outcome:
+            async with session.get(url) as response:
+                outcome["status"] = response.status
+                if response.status == 200:
+                    data = await response.json()
+                    # Handle the API's specific response structure (DaaS routes capitalize it)
+                    if 'body' in data:
+                        return data['body'], None
+                    if 'Body' in data:
+                        return data['Body'], None
+                    return data, None
+                else:
+                    error_message = f"Failed to fetch {url}: Status {response.status}"
+                    try:
+                        # Attempt to read response body for more details
+                        response_text = await response.text()
+                        error_message += f", Response: {response_text[:500]}" # Log first 500 chars
+                    except Exception as text_e:
+                        logging.warning(f"Could not read response text for {url}: {text_e}")
+                    logging.error(error_message)
+                    return None, f"Status {response.status}"
     except aiohttp.ClientError as e:
         logging.error(f"Client error fetching {url}: {e}", exc_info=True)
-        return None
+        return None, f"Client error: {e}"
     except asyncio.TimeoutError:
         logging.error(f"Timeout fetching {url}")
-        return None
+        return None, "Timeout"
     except Exception as e:
         logging.error(f"Unexpected exception fetching {url}: {e}", exc_info=True)
-        return None
+        return None, f"Unexpected exception: {e}"
 
-def init_db():
-    """Initialize the SQLite database."""
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    
-    # Vehicles table (denormalized for easier querying, or normalized as requested)
-    # We'll store the hierarchy: Year -> Make -> Model
+async def fetch_json(session, url):
+    """Fetch JSON from a URL with error handling."""
+    body, _ = await fetch_json_result(session, url)
+    return body
+
+def create_schema(c):
+    """Create the vehicle tables (without secondary indexes)."""
+    # We store the hierarchy: Year -> Make -> Model -> Engine
+    # Models get an integer surrogate key; the TEXT vehicleId is stored once and
+    # everything else references the integer.
     c.execute('''
         CREATE TABLE IF NOT EXISTS years (
             year INTEGER PRIMARY KEY,
             status TEXT DEFAULT 'pending' -- 'pending', 'completed'
         )
     ''')
-    
+
     c.execute('''
         CREATE TABLE IF NOT EXISTS makes (
-            id INTEGER,
-            name TEXT,
-            year INTEGER,
-            PRIMARY KEY (id, year)
+            id INTEGER PRIMARY KEY, -- makeId
+            name TEXT NOT NULL
         )
     ''')
-    
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS year_makes (
+            year INTEGER NOT NULL,
+            make_id INTEGER NOT NULL,
+            PRIMARY KEY (year, make_id)
+        ) WITHOUT ROWID
+    ''')
+
     c.execute('''
         CREATE TABLE IF NOT EXISTS models (
-            id TEXT PRIMARY KEY, -- vehicleId
+            id INTEGER PRIMARY KEY, -- surrogate key
+            vehicle_id TEXT NOT NULL, -- vehicleId, e.g. 188569:13820
             name TEXT,
             year INTEGER,
-            make_id INTEGER,
-            make_name TEXT
+            make_id INTEGER
         )
     ''')
-    
+
     c.execute('''
         CREATE TABLE IF NOT EXISTS engines (
-            id TEXT PRIMARY KEY, -- vehicleId:engineId
-            vehicle_id TEXT,
+            model_id INTEGER NOT NULL,
+            engine_key TEXT NOT NULL, -- engine id as returned by the API
             name TEXT,
-            FOREIGN KEY (vehicle_id) REFERENCES models(id)
+            PRIMARY KEY (model_id, engine_key),
+            FOREIGN KEY (model_id) REFERENCES models(id)
+        ) WITHOUT ROWID
+    ''')
+
+    # Chek-Chart catalog: Year -> Make code -> Model code -> Engine code -> DaaS vehicles
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS chek_chart_years (
+            year INTEGER PRIMARY KEY,
+            status TEXT DEFAULT 'pending' -- 'pending', 'completed'
         )
     ''')
-    
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS chek_chart_makes (
+            make_code TEXT PRIMARY KEY, -- two-letter make code
+            name TEXT
+        ) WITHOUT ROWID
+    ''')
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS chek_chart_models (
+            year INTEGER NOT NULL,
+            make_code TEXT NOT NULL,
+            model_code TEXT NOT NULL, -- five-character model code
+            name TEXT,
+            PRIMARY KEY (year, make_code, model_code)
+        ) WITHOUT ROWID
+    ''')
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS chek_chart_engines (
+            year INTEGER NOT NULL,
+            make_code TEXT NOT NULL,
+            model_code TEXT NOT NULL,
+            engine_code TEXT NOT NULL, -- one-character engine code
+            name TEXT,
+            liters TEXT,
+            cylinders TEXT,
+            fuel TEXT,
+            PRIMARY KEY (year, make_code, model_code, engine_code)
+        ) WITHOUT ROWID
+    ''')
+
+    # One row per DaaS vehicle behind a Chek-Chart engine. motor_model_id points at the
+    # matching Motor catalog row (models.id) once link_chek_chart_vehicles() finds one.
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS chek_chart_vehicles (
+            year INTEGER NOT NULL,
+            make_code TEXT NOT NULL,
+            model_code TEXT NOT NULL,
+            engine_code TEXT NOT NULL,
+            vehicle_id INTEGER NOT NULL, -- DaaS VehicleID
+            base_vehicle_id INTEGER,
+            engine_id INTEGER,
+            make_name TEXT,
+            model_name TEXT,
+            sub_model TEXT,
+            motor_model_id INTEGER,
+            PRIMARY KEY (year, make_code, model_code, engine_code, vehicle_id),
+            FOREIGN KEY (motor_model_id) REFERENCES models(id)
+        ) WITHOUT ROWID
+    ''')
+
+    # Fluids are published per base vehicle; status drives resume like years.status
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS fluid_vehicles (
+            base_vehicle_id INTEGER PRIMARY KEY,
+            status TEXT DEFAULT 'pending' -- 'pending', 'completed'
+        )
+    ''')
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS fluid_capacities (
+            base_vehicle_id INTEGER NOT NULL,
+            application_id INTEGER NOT NULL,
+            spec_id INTEGER NOT NULL,
+            name TEXT, -- e.g. "Engine Oil"
+            system TEXT,
+            position TEXT,
+            engine_id INTEGER, -- NULL when the capacity applies to every engine
+            qualifiers TEXT,
+            value TEXT,
+            min_value TEXT,
+            max_value TEXT,
+            unit TEXT,
+            PRIMARY KEY (base_vehicle_id, application_id, spec_id)
+        ) WITHOUT ROWID
+    ''')
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS fluid_specs (
+            base_vehicle_id INTEGER NOT NULL,
+            application_id INTEGER NOT NULL,
+            fluid_id INTEGER NOT NULL,
+            name TEXT,
+            engine_id INTEGER,
+            trade_name TEXT,
+            viscosity TEXT,
+            grade TEXT,
+            spec_standard TEXT,
+            quantity REAL,
+            unit TEXT,
+            PRIMARY KEY (base_vehicle_id, application_id, fluid_id)
+        ) WITHOUT ROWID
+    ''')
+
+def create_indexes(conn):
+    """Create the secondary indexes (idempotent)."""
+    c = conn.cursor()
+    for _, ddl in INDEXES:
+        c.execute(ddl)
+    conn.commit()
+
+def drop_indexes(conn):
+    """Drop the secondary indexes so a bulk load writes only table pages."""
+    c = conn.cursor()
+    for name, _ in INDEXES:
+        c.execute(f'DROP INDEX IF EXISTS {name}')
     conn.commit()
-    # Create indexes for performance
-    c.execute('CREATE INDEX IF NOT EXISTS idx_years_status ON years(status)')
-    c.execute('CREATE INDEX IF NOT EXISTS idx_makes_year ON makes(year)')
-    c.execute('CREATE INDEX IF NOT EXISTS idx_models_year ON models(year)')
-    c.execute('CREATE INDEX IF NOT EXISTS idx_models_make_id ON models(make_id)')
-    c.execute('CREATE INDEX IF NOT EXISTS idx_engines_vehicle_id ON engines(vehicle_id)')
+
+def schema_version(conn):
+    """Return the schema version of an existing database, or None for a new file.
+
+    Databases written before versioning have user_version 0 and the TEXT-keyed layout.
+    """
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'models'").fetchone():
+        return None
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def has_crawled_data(conn):
+    """Return True if any source has already written vehicles."""
+    return any(conn.execute(f'SELECT EXISTS (SELECT 1 FROM {table})').fetchone()[0]
+               for table in ('models', 'chek_chart_models', 'fluid_vehicles'))
+
+def migrate_legacy_schema(conn):
+    """Move data from the TEXT-keyed layout into the compact schema.
+
+    Runs as one transaction, so a failure leaves the legacy tables as they were
+    and the next run starts the migration over.
+    """
+    print("Migrating existing database to the compact schema...")
+    logging.info("Migrating legacy schema to version %d", SCHEMA_VERSION)
+    c = conn.cursor()
+    c.execute('BEGIN')
+    try:
+        c.execute('ALTER TABLE makes RENAME TO legacy_makes')
+        c.execute('ALTER TABLE models RENAME TO legacy_models')
+        c.execute('ALTER TABLE engines RENAME TO legacy_engines')
+        for name in ('idx_makes_year', 'idx_models_year', 'idx_models_make_id', 'idx_engines_vehicle_id'):
+            c.execute(f'DROP INDEX IF EXISTS {name}')
+
+        create_schema(c)
+        c.execute('''
+            INSERT OR REPLACE INTO makes (id, name)
+            SELECT id, name FROM legacy_makes
+        ''')
+        c.execute('''
+            INSERT OR IGNORE INTO year_makes (year, make_id)
+            SELECT year, id FROM legacy_makes
+        ''')
+        # A model without a vehicleId can't be addressed by any route; leave it behind
+        c.execute('''
+            INSERT INTO models (vehicle_id, name, year, make_id)
+            SELECT id, name, year, make_id FROM legacy_models WHERE id IS NOT NULL
+            ORDER BY year, make_id, name
+        ''')
+        skipped = c.execute('SELECT COUNT(*) FROM legacy_models WHERE id IS NULL').fetchone()[0]
+        if skipped:
+            logging.warning("Migration skipped %d legacy models without a vehicleId", skipped)
+        # Inline rather than create_indexes(), which would commit halfway through
+        for _, ddl in INDEXES:
+            c.execute(ddl)
+        c.execute('''
+            INSERT OR REPLACE INTO engines (model_id, engine_key, name)
+            SELECT m.id, e.id, e.name
+            FROM legacy_engines e JOIN models m ON m.vehicle_id = e.vehicle_id
+        ''')
+        c.execute('DROP TABLE legacy_makes')
+        c.execute('DROP TABLE legacy_models')
+        c.execute('DROP TABLE legacy_engines')
+        c.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    # Reclaim the pages freed by the old tables (VACUUM can't run inside a transaction)
+    c.execute('VACUUM')
+
+def init_db(bulk=False):
+    """Initialize the SQLite database.
+
+    In bulk mode the secondary indexes are dropped and journaling is relaxed;
+    call finish_bulk_load() once the crawl is done to build them. Bulk mode is only
+    allowed on a new or empty database, since a crash without a journal can corrupt
+    the file and existing data would be lost with it.
+    """
+    conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+    c = conn.cursor()
+
+    version = schema_version(conn)
+    if version is not None and version < 2:
+        migrate_legacy_schema(conn)
+
+    create_schema(c)
+    c.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
     conn.commit()
+
+    if bulk:
+        if has_crawled_data(conn):
+            conn.close()
+            raise RuntimeError(f"--bulk is only for an initial load into a new or empty '{DB_FILE}'; "
+                               "run without it to resume")
+        # A crash during a bulk load can corrupt the file; delete it and rerun in that case
+        c.execute('PRAGMA journal_mode = OFF')
+        c.execute('PRAGMA synchronous = OFF')
+        c.execute('PRAGMA temp_store = MEMORY')
+        c.execute(f'PRAGMA cache_size = {BULK_CACHE_KIB}')
+        drop_indexes(conn)
+    else:
+        create_indexes(conn)
     return conn
 
-async def process_year(session, year, conn, semaphore):
+def finish_bulk_load(conn):
+    """Build indexes and restore durable journaling after a bulk load."""
+    print("Building indexes...")
+    create_indexes(conn)
+    c = conn.cursor()
+    c.execute('ANALYZE')
+    c.execute('PRAGMA journal_mode = DELETE')
+    c.execute('PRAGMA synchronous = FULL')
+    conn.commit()
+
+class ModelIds:
+    """In-memory vehicleId -> surrogate id map.
+
+    Surrogate ids are assigned here rather than by SQLite so that inserts never
+    need an index lookup, which keeps bulk loads on unindexed tables fast.
+    """
+
+    def __init__(self, conn):
+        self.ids = dict(conn.execute('SELECT vehicle_id, id FROM models'))
+        self.next_id = max(self.ids.values(), default=0) + 1
+
+    def get(self, vehicle_id):
+        model_id = self.ids.get(vehicle_id)
+        if model_id is None:
+            model_id = self.ids[vehicle_id] = self.next_id
+            self.next_id += 1
+        return model_id
+
+async def process_year(session, year, conn, semaphore, model_ids):
     """Process a single year: fetch makes, then models/engines."""
     
     # Check if year is already completed
@@ -111,7 +381,7 @@ async def process_year(session, year, conn, semaphore):
 
     # Insert year if not exists
     c.execute("INSERT OR IGNORE INTO years (year, status) VALUES (?, 'pending')", (year,))
-    conn.commit()
+    metrics.commit(conn)
 
     # Fetch Makes
     url = f"{BASE_URL}/year/{year}/makes"
@@ -123,25 +393,31 @@ async def process_year(session, year, conn, semaphore):
         return
 
     # Store Makes
-    c.executemany(
-        "INSERT OR REPLACE INTO makes (id, name, year) VALUES (?, ?, ?)",
-        [(m['makeId'], m['makeName'], year) for m in makes]
-    )
-    conn.commit()
+    with metrics.db_write("makes", len(makes)):
+        c.executemany(
+            "INSERT OR REPLACE INTO makes (id, name) VALUES (?, ?)",
+            [(m['makeId'], m['makeName']) for m in makes]
+        )
+    with metrics.db_write("year_makes", len(makes)):
+        c.executemany(
+            "INSERT OR IGNORE INTO year_makes (year, make_id) VALUES (?, ?)",
+            [(year, m['makeId']) for m in makes]
+        )
+    metrics.commit(conn)
 
     # Process Makes (Fetch Models)
     # We create tasks for fetching models for all makes in this year
     tasks = []
     for make in makes:
-        tasks.append(process_make(session, year, make, conn, semaphore))
+        tasks.append(process_make(session, year, make, conn, semaphore, model_ids))
     
     await asyncio.gather(*tasks)
 
     # Mark year as completed
     c.execute("UPDATE years SET status = 'completed' WHERE year = ?", (year,))
-    conn.commit()
+    metrics.commit(conn)
 
-async def process_make(session, year, make, conn, semaphore):
+async def process_make(session, year, make, conn, semaphore, model_ids):
     """Fetch models for a specific make and year."""
     make_name = make['makeName']
     make_id = make['makeId']
@@ -163,13 +439,13 @@ async def process_make(session, year, make, conn, semaphore):
     engine_rows = []
     
     for model in models:
-        model_id = model['id']
-        model_name = model['model']
-        model_rows.append((model_id, model_name, year, make_id, make_name))
+        vehicle_id = model['id']
+        model_id = model_ids.get(vehicle_id)
+        model_rows.append((model_id, vehicle_id, model['model'], year, make_id))
         
         if 'engines' in model:
             for engine in model['engines']:
-                engine_rows.append((engine['id'], model_id, engine['name']))
+                engine_rows.append((model_id, engine['id'], engine['name']))
     
     # Insert into DB (using a new cursor for thread safety if needed, though sqlite3 in python is tricky with threads, 
     # but here we are in async single thread usually. However, aiohttp runs in event loop. 
@@ -178,61 +454,352 @@ async def process_make(session, year, make, conn, semaphore):
     
     try:
         c = conn.cursor()
+        with metrics.db_write("models", len(model_rows)):
+            c.executemany(
+                "INSERT OR REPLACE INTO models (id, vehicle_id, name, year, make_id) VALUES (?, ?, ?, ?, ?)",
+                model_rows
+            )
+        with metrics.db_write("engines", len(engine_rows)):
+            c.executemany(
+                "INSERT OR REPLACE INTO engines (model_id, engine_key, name) VALUES (?, ?, ?)",
+                engine_rows
+            )
+        metrics.commit(conn)
+    except sqlite3.Error as e:
+        logging.error(f"Database error for {year} {make_name}: {e}")
+
+def chek_chart_url(*parts):
+    """DaaS Chek-Chart route on the proxy, e.g. chek_chart_url(2018, "Makes")."""
+    return f"{BASE_URL}/Information/Chek-Chart/Years/" + "/".join(quote(str(p), safe='') for p in parts)
+
+async def process_chek_chart_year(session, year, conn, semaphore):
+    """Process a single Chek-Chart year: fetch make codes, then models, engines and vehicles."""
+    c = conn.cursor()
+    c.execute("SELECT status FROM chek_chart_years WHERE year = ?", (year,))
+    row = c.fetchone()
+    if row and row[0] == 'completed':
+        return f"Chek-Chart year {year} already completed."
+
+    c.execute("INSERT OR IGNORE INTO chek_chart_years (year, status) VALUES (?, 'pending')", (year,))
+    metrics.commit(conn)
+
+    async with semaphore:
+        makes = await fetch_json(session, chek_chart_url(year, "Makes"))
+
+    if not makes:
+        logging.warning(f"No Chek-Chart makes found for year {year}")
+        return
+
+    with metrics.db_write("chek_chart_makes", len(makes)):
         c.executemany(
-            "INSERT OR REPLACE INTO models (id, name, year, make_id, make_name) VALUES (?, ?, ?, ?, ?)",
-            model_rows
-        )
-        c.executemany(
-            "INSERT OR REPLACE INTO engines (id, vehicle_id, name) VALUES (?, ?, ?)",
-            engine_rows
+            "INSERT OR REPLACE INTO chek_chart_makes (make_code, name) VALUES (?, ?)",
+            [(m['MakeCode'], m.get('MakeName')) for m in makes]
         )
-        conn.commit()
+    metrics.commit(conn)
+
+    await asyncio.gather(*[process_chek_chart_make(session, year, m['MakeCode'], conn, semaphore) for m in makes])
+
+    c.execute("UPDATE chek_chart_years SET status = 'completed' WHERE year = ?", (year,))
+    metrics.commit(conn)
+
+async def process_chek_chart_make(session, year, make_code, conn, semaphore):
+    """Fetch the model codes for a make code and year."""
+    async with semaphore:
+        models = await fetch_json(session, chek_chart_url(year, "Makes", make_code, "Models"))
+
+    if not models:
+        return
+
+    try:
+        with metrics.db_write("chek_chart_models", len(models)):
+            conn.executemany(
+                "INSERT OR REPLACE INTO chek_chart_models (year, make_code, model_code, name) VALUES (?, ?, ?, ?)",
+                [(year, make_code, m['ModelCode'], m.get('ModelName')) for m in models]
+            )
+        metrics.commit(conn)
     except sqlite3.Error as e:
-        logging.error(f"Database error for {year} {make_name}: {e}")
+        logging.error(f"Database error for Chek-Chart {year} {make_code}: {e}")
+        return
+
+    await asyncio.gather(*[process_chek_chart_model(session, year, make_code, m['ModelCode'], conn, semaphore)
+                           for m in models])
+
+async def process_chek_chart_model(session, year, make_code, model_code, conn, semaphore):
+    """Fetch the engine codes for a model, then the DaaS vehicles behind each engine."""
+    async with semaphore:
+        engines = await fetch_json(session, chek_chart_url(year, "Makes", make_code, "Models", model_code, "Engines"))
+
+    if not engines:
+        return
+
+    async def fetch_vehicles(engine_code):
+        # This one route is spelled without the hyphen
+        url = (f"{BASE_URL}/Information/ChekChart/Years/{year}/Makes/{quote(make_code, safe='')}"
+               f"/Models/{quote(model_code, safe='')}/Engines/{quote(engine_code, safe='')}/Vehicles")
+        async with semaphore:
+            return await fetch_json(session, url)
+
+    results = await asyncio.gather(*[fetch_vehicles(e['EngineCode']) for e in engines])
 
-async def main():
+    engine_rows = [(year, make_code, model_code, e['EngineCode'], e.get('EngineName'), e.get('Liters'),
+                    e.get('Cylinders'), e.get('Fuel')) for e in engines]
+    vehicle_rows = []
+    for engine, result in zip(engines, results):
+        if not result:
+            continue
+        sub_models = {s['SubModelID']: s.get('SubModelName')
+                      for s in (result.get('Attributes') or {}).get('SubModels') or []}
+        for v in result.get('VehicleByChekChart') or []:
+            vehicle_rows.append((
+                year, make_code, model_code, engine['EngineCode'], v['VehicleID'], v.get('BaseVehicleID'),
+                v.get('EngineID'), (v.get('Make') or {}).get('MakeName'), (v.get('Model') or {}).get('ModelName'),
+                sub_models.get(v.get('SubModelID')),
+            ))
+
+    try:
+        c = conn.cursor()
+        with metrics.db_write("chek_chart_engines", len(engine_rows)):
+            c.executemany(
+                "INSERT OR REPLACE INTO chek_chart_engines "
+                "(year, make_code, model_code, engine_code, name, liters, cylinders, fuel) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                engine_rows
+            )
+        # Keep an existing Motor cross-reference when a vehicle is re-crawled
+        with metrics.db_write("chek_chart_vehicles", len(vehicle_rows)):
+            c.executemany(
+                "INSERT INTO chek_chart_vehicles (year, make_code, model_code, engine_code, vehicle_id, base_vehicle_id, "
+                "engine_id, make_name, model_name, sub_model) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (year, make_code, model_code, engine_code, vehicle_id) DO UPDATE SET "
+                "base_vehicle_id = excluded.base_vehicle_id, engine_id = excluded.engine_id, "
+                "make_name = excluded.make_name, model_name = excluded.model_name, sub_model = excluded.sub_model",
+                vehicle_rows
+            )
+        base_vehicles = {(row[5],) for row in vehicle_rows if row[5] is not None}
+        with metrics.db_write("fluid_vehicles", len(base_vehicles)):
+            c.executemany("INSERT OR IGNORE INTO fluid_vehicles (base_vehicle_id, status) VALUES (?, 'pending')",
+                          base_vehicles)
+        metrics.commit(conn)
+    except sqlite3.Error as e:
+        logging.error(f"Database error for Chek-Chart {year} {make_code} {model_code}: {e}")
+
+def _engine_id(application):
+    """The EngineID an application is limited to, or None if it covers every engine."""
+    for mapping in application.get('AttributeMappings') or []:
+        if mapping.get('Type') == 'EN':
+            return mapping.get('ID')
+    return None
+
+async def process_fluids(session, base_vehicle_id, conn, semaphore):
+    """Fetch the fluid applications (with capacities) for one base vehicle, page by page."""
+    applications = []
+    page = 0
+    while True:
+        url = (f"{BASE_URL}/Information/Vehicles/Attributes/BaseVehicleID/{base_vehicle_id}/Content/Summaries/Of/Fluids"
+               f"?Include=Capacities&Include=Details&ItemsPerPage={FLUIDS_PAGE_SIZE}&PageIndex={page}")
+        async with semaphore:
+            body, error = await fetch_json_result(session, url)
+        if error:
+            # Leave the vehicle pending so the next run retries it
+            return
+        batch = (body or {}).get('Applications') or []
+        applications.extend(batch)
+        # A short page is the last one; this only holds while FLUIDS_PAGE_SIZE is
+        # within the server's page cap, or every page would look short
+        if len(batch) < FLUIDS_PAGE_SIZE:
+            break
+        page += 1
+
+    capacity_rows = []
+    spec_rows = []
+    for app in applications:
+        app_id = app['ApplicationID']
+        name = app.get('DisplayName')
+        engine_id = _engine_id(app)
+        taxonomy = app.get('Taxonomy') or {}
+        position = (app.get('Position') or {}).get('Name')
+        qualifiers = "; ".join(q['Description'] for q in app.get('Qualifiers') or [] if q.get('Description')) or None
+        for capacity in app.get('Capacities') or []:
+            for spec in capacity.get('Items') or []:
+                capacity_rows.append((
+                    base_vehicle_id, app_id, spec['SpecificationID'], name, taxonomy.get('SystemName'), position,
+                    _engine_id(capacity) or engine_id, qualifiers, spec.get('Value'), spec.get('MinValue'),
+                    spec.get('MaxValue'), spec.get('UnitOfMeasure'),
+                ))
+        for fluid in app.get('Items') or []:
+            spec_rows.append((
+                base_vehicle_id, app_id, fluid['FluidID'], name, engine_id, fluid.get('TradeName'),
+                fluid.get('Viscosity'), (fluid.get('Grade') or {}).get('Description'), fluid.get('SpecStandard'),
+                fluid.get('Quantity'), fluid.get('UnitOfMeasure'),
+            ))
+
+    try:
+        c = conn.cursor()
+        c.execute("DELETE FROM fluid_capacities WHERE base_vehicle_id = ?", (base_vehicle_id,))
+        c.execute("DELETE FROM fluid_specs WHERE base_vehicle_id = ?", (base_vehicle_id,))
+        with metrics.db_write("fluid_capacities", len(capacity_rows)):
+            c.executemany("INSERT OR REPLACE INTO fluid_capacities VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                          capacity_rows)
+        with metrics.db_write("fluid_specs", len(spec_rows)):
+            c.executemany("INSERT OR REPLACE INTO fluid_specs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", spec_rows)
+        c.execute("UPDATE fluid_vehicles SET status = 'completed' WHERE base_vehicle_id = ?", (base_vehicle_id,))
+        metrics.commit(conn)
+    except sqlite3.Error as e:
+        logging.error(f"Database error for fluids of base vehicle {base_vehicle_id}: {e}")
+
+def link_chek_chart_vehicles(conn):
+    """Point Chek-Chart vehicles at Motor catalog models (models.id).
+
+    The two catalogs share no identifier, so vehicles are matched on year, make name
+    and model name, preferring a Motor model named "<model> <sub-model>" (Motor model
+    names include the trim) over the bare model name. Only unlinked rows are looked
+    at, so this is cheap to rerun after either crawl.
+    """
+    c = conn.cursor()
+    c.execute('''
+        UPDATE chek_chart_vehicles SET motor_model_id = (
+            SELECT m.id
+            FROM makes k JOIN models m ON m.make_id = k.id AND m.year = chek_chart_vehicles.year
+            WHERE k.name = chek_chart_vehicles.make_name COLLATE NOCASE
+              AND m.name COLLATE NOCASE IN (chek_chart_vehicles.model_name || ' ' || chek_chart_vehicles.sub_model,
+                                            chek_chart_vehicles.model_name)
+            ORDER BY length(m.name) DESC, m.id -- the "<model> <sub-model>" match, when there is one
+            LIMIT 1
+        )
+        WHERE motor_model_id IS NULL
+    ''')
+    linked = c.rowcount
+    conn.commit()
+    return linked
+
+def fluid_capacities(conn, vehicle_id):
+    """Fluid capacities for a Motor vehicleId, answered from the local Chek-Chart/fluids tables.
+
+    Returns (name, system, position, engine_id, value, unit, qualifiers) rows; engine_id
+    is None for capacities shared by every engine.
+    """
+    return conn.execute('''
+        SELECT DISTINCT f.name, f.system, f.position, f.engine_id, f.value, f.unit, f.qualifiers
+        FROM models m
+        JOIN chek_chart_vehicles v ON v.motor_model_id = m.id
+        JOIN fluid_capacities f ON f.base_vehicle_id = v.base_vehicle_id
+             AND (f.engine_id IS NULL OR f.engine_id = v.engine_id)
+        WHERE m.vehicle_id = ?
+        ORDER BY f.system, f.name, f.engine_id
+    ''', (vehicle_id,)).fetchall()
+
+async def crawl_chek_chart(session, conn, semaphore):
+    """Crawl the Chek-Chart catalog, then fluids for every base vehicle it references."""
+    print("Fetching available Chek-Chart years...")
+    years_data = await fetch_json(session, f"{BASE_URL}/Information/Chek-Chart/Years")
+
+    if not years_data:
+        print("❌ Failed to fetch Chek-Chart years.")
+        return
+
+    years = sorted((y['Year'] for y in years_data), reverse=True)
+    print(f"Found {len(years)} Chek-Chart years: {years[0]} - {years[-1]}")
+
+    c = conn.cursor()
+    for year in years:
+        c.execute("INSERT OR IGNORE INTO chek_chart_years (year, status) VALUES (?, 'pending')", (year,))
+    conn.commit()
+
+    tasks = [process_chek_chart_year(session, year, conn, semaphore) for year in years]
+    for f in tqdm.as_completed(tasks, total=len(years), desc="Processing Chek-Chart Years"):
+        await f
+
+    base_vehicles = [row[0] for row in conn.execute("SELECT base_vehicle_id FROM fluid_vehicles WHERE status != 'completed'")]
+    tasks = [process_fluids(session, base_vehicle_id, conn, semaphore) for base_vehicle_id in base_vehicles]
+    for f in tqdm.as_completed(tasks, total=len(tasks), desc="Fetching Fluids"):
+        await f
+
+async def crawl_motor(session, conn, semaphore, model_ids):
+    """Crawl the Motor catalog: years, makes, models and engines."""
+    # Fetch Years
+    print("Fetching available years...")
+    years_data = await fetch_json(session, f"{BASE_URL}/years")
+
+    if not years_data:
+        print("❌ Failed to fetch years.")
+        return
+
+    years = sorted(years_data, reverse=True) # Process newest first
+    print(f"Found {len(years)} years: {years[0]} - {years[-1]}")
+
+    # Initialize years in DB
+    c = conn.cursor()
+    for year in years:
+        c.execute("INSERT OR IGNORE INTO years (year, status) VALUES (?, 'pending')", (year,))
+    conn.commit()
+
+    # Process years with progress bar
+    # We process years sequentially or in small batches to avoid too much context switching and memory usage
+    # But we can parallelize makes within a year, or parallelize years.
+    # Let's parallelize years with a limit.
+
+    tasks = [process_year(session, year, conn, semaphore, model_ids) for year in years]
+
+    # Use tqdm to show progress
+    for f in tqdm.as_completed(tasks, total=len(years), desc="Processing Years"):
+        await f
+
+async def main(bulk=False, source="motor"):
     print("🚀 Starting Vehicle DB Population...")
     
     # Initialize DB
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False) # Needed for async access if we were threading, but good practice
-    init_db()
+    try:
+        conn = init_db(bulk=bulk)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return
+    model_ids = ModelIds(conn)
     
     timeout = aiohttp.ClientTimeout(total=30)
     connector = aiohttp.TCPConnector(ssl=False)
     async with aiohttp.ClientSession(timeout=timeout, connector=connector, headers={"User-Agent": "VehicleDBPopulator/1.0"}) as session:
-        # Fetch Years
-        print("Fetching available years...")
-        years_data = await fetch_json(session, f"{BASE_URL}/years")
-        
-        if not years_data:
-            print("❌ Failed to fetch years. Exiting.")
-            return
+        # Semaphore to limit concurrency, shared by every source
+        semaphore = metrics.TrackedSemaphore(CONCURRENT_REQUESTS, "crawl")
 
-        years = sorted(years_data, reverse=True) # Process newest first
-        print(f"Found {len(years)} years: {years[0]} - {years[-1]}")
-        
-        # Initialize years in DB
-        c = conn.cursor()
-        for year in years:
-            c.execute("INSERT OR IGNORE INTO years (year, status) VALUES (?, 'pending')", (year,))
-        conn.commit()
-
-        # Semaphore to limit concurrency
-        semaphore = asyncio.Semaphore(CONCURRENT_REQUESTS)
-        
-        # Process years with progress bar
-        # We process years sequentially or in small batches to avoid too much context switching and memory usage
-        # But we can parallelize makes within a year, or parallelize years.
-        # Let's parallelize years with a limit.
-        
-        tasks = [process_year(session, year, conn, semaphore) for year in years]
-        
-        # Use tqdm to show progress
-        for f in tqdm.as_completed(tasks, total=len(years), desc="Processing Years"):
-            await f
+        if source in ("motor", "all"):
+            await crawl_motor(session, conn, semaphore, model_ids)
+        if source in ("chek-chart", "all"):
+            await crawl_chek_chart(session, conn, semaphore)
 
+    if bulk:
+        finish_bulk_load(conn)
+    # Runs after the index build so the model lookups use idx_models_ymm
+    linked = link_chek_chart_vehicles(conn)
+    if linked:
+        print(f"🔗 Linked {linked} Chek-Chart vehicles to Motor models")
     conn.close()
     print("\n✅ Database population complete! Saved to 'vehicles.db'")
 
+def print_capacities(vehicle_id):
+    conn = sqlite3.connect(DB_FILE)
+    rows = fluid_capacities(conn, vehicle_id)
+    conn.close()
+    if not rows:
+        print(f"❌ No local capacities for {vehicle_id} (crawl with --source chek-chart first)")
+        return
+    print(f"🛢️ Fluid capacities for {vehicle_id}:")
+    for name, system, position, engine_id, value, unit, qualifiers in rows:
+        label = " / ".join(part for part in (system, name, position) if part)
+        suffix = f" [engine {engine_id}]" if engine_id is not None else ""
+        suffix += f" ({qualifiers})" if qualifiers else ""
+        print(f"  {label}: {value} {unit or ''}".rstrip() + suffix)
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Populate the local vehicles database")
+    parser.add_argument("--bulk", action="store_true",
+                        help="Initial-load mode: unindexed tables, no journal, indexes built at the end")
+    parser.add_argument("--source", choices=["motor", "chek-chart", "all"], default="motor",
+                        help="Catalog to crawl: Motor years/makes/models, or Chek-Chart codes plus fluid capacities")
+    parser.add_argument("--capacities", metavar="VEHICLE_ID",
+                        help="Print the locally stored fluid capacities for a vehicleId and exit")
+    metrics.add_arguments(parser, "populate_db")
+    args = parser.parse_args()
+    if args.capacities:
+        print_capacities(args.capacities)
+        raise SystemExit
+    with metrics.instrumented(args):
+        asyncio.run(main(bulk=args.bulk, source=args.source))
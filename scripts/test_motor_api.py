@@ -18,6 +18,8 @@ from typing import Dict, List, Optional
 from dataclasses import dataclass, field
 from enum import Enum
 
+import metrics
+
 # Configuration
 PROXY_BASE = "https://autolib.web.app/api/motor-proxy/api"
 DIRECT_MOTOR = "https://sites.motor.com/m1/api"  # Alternative if proxy fails
@@ -75,7 +77,10 @@ class MotorAPITester:
         url = f"{self.base_url}{path}"
         kwargs.setdefault("timeout", TIMEOUT)
         kwargs.setdefault("verify", False)
-        return self.session.request(method, url, **kwargs)
+        with metrics.track_request(url) as outcome:
+            response = self.session.request(method, url, **kwargs)
+            outcome["status"] = response.status_code
+        return response
     
     def test(self, method: str, path: str, description: str = "") -> TestResult:
         """Test an endpoint and record result"""
@@ -429,15 +434,17 @@ def main():
     parser.add_argument("--quick", action="store_true", help="Run quick test only")
     parser.add_argument("--base-url", default=PROXY_BASE, help="Base URL for API")
     parser.add_argument("--direct", action="store_true", help="Use direct Motor URL instead of proxy")
+    metrics.add_arguments(parser, "test_motor_api")
     args = parser.parse_args()
     
     base_url = DIRECT_MOTOR if args.direct else args.base_url
     tester = MotorAPITester(base_url)
     
-    if args.quick:
-        tester.run_quick()
-    else:
-        tester.run_all()
+    with metrics.instrumented(args):
+        if args.quick:
+            tester.run_quick()
+        else:
+            tester.run_all()
 
 
 if __name__ == "__main__":
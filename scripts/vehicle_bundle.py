@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+Vehicle Bundle
+Packs everything available for one vehicle into a single file for offline
+use: the per-vehicle proxy routes (DTCs, TSBs, specs, fluids, labor,
+maintenance, ...), the article bodies from the article store and every
+graphic those reference, from the asset mirror.
+
+Layout (all integers little-endian):
+
+    header   MAGIC
+    entries  item bodies back to back, each zlib-compressed or raw
+    index    fixed-width records sorted by key hash (INDEX_RECORD)
+    keys     UTF-8 keys, referenced from the index records
+    meta     JSON: vehicleId, created, content types
+    footer   FOOTER: index/keys/meta offsets, record count, MAGIC
+
+Opening a bundle reads only the footer and meta; lookups binary-search the
+mmapped index. Raw entries (graphics) are returned as memoryviews into the
+map, compressed ones are inflated one at a time. Reading and serving use only
+the standard library, so a shop machine needs nothing else; export lives in
+bundle_export.py and is imported only by the export command.
+
+Usage:
+    python vehicle_bundle.py export 188569:13820                 # -> 188569_13820.bundle
+    python vehicle_bundle.py ls 188569_13820.bundle
+    python vehicle_bundle.py get 188569_13820.bundle source/MOTOR/vehicle/188569:13820/dtcs
+    python vehicle_bundle.py check 188569_13820.bundle
+    python vehicle_bundle.py serve 188569_13820.bundle --port 8082
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import tempfile
+import zlib
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlencode
+
+# Configuration
+MAGIC = b"CRUISBN1"
+ZLIB_LEVEL = 9
+MIN_SAVING = 0.1  # Store raw unless compression saves at least this fraction
+DEFAULT_PORT = 8082
+
+# key hash, entry offset, stored length, raw length, key offset, key length, codec, content type
+INDEX_RECORD = struct.Struct("<16sQIIIHBB")
+FOOTER = struct.Struct("<QQQQQ8s")  # index offset, keys offset, meta offset, meta length, records, MAGIC
+CODEC_RAW, CODEC_ZLIB = 0, 1
+JSON_TYPE = "application/json"
+
+# Resize parameters graphic routes keep in their keys (see asset_mirror.handle_key)
+GRAPHIC_RE = re.compile(r'^(?:source|manufacturer)/[^/]+/graphic/[^/]+$')
+GRAPHIC_PARAMS = ("w", "h")
+
+# The proxy redirects DTC and TSB details to the article route; bundles store them once, there
+ARTICLE_ALIAS_RE = re.compile(r'^(source/[^/]+/vehicle/[^/]+)/(?:dtc|tsb)/([^/]+)$')
+
+
+def key_hash(key):
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+
+def route_key(path):
+    """Normalize a proxy URL or path to a bundle key: relative to /api, unquoted.
+
+    Graphic routes keep their w/h resize parameters as a sorted query; any other
+    query parameters are dropped.
+    """
+    path, _, query = path.partition("?")
+    # Proxy URLs carry two /api/ segments (/api/motor-proxy/api/...); routes follow the last
+    key = unquote(("/" + path.lstrip("/")).rsplit("/api/", 1)[-1]).strip("/")
+    params = {k: v for k, v in parse_qsl(query) if k in GRAPHIC_PARAMS and v}
+    if params and GRAPHIC_RE.match(key):
+        key += "?" + urlencode(sorted(params.items()))
+    return key
+
+
+def bundle_key(path):
+    """route_key, with DTC/TSB detail routes mapped to the article they redirect to."""
+    return ARTICLE_ALIAS_RE.sub(r'\1/article/\2', route_key(path))
+
+
+def article_key(source, vehicle_id, article_id):
+    return f"source/{source}/vehicle/{vehicle_id}/article/{article_id}"
+
+
+class BundleWriter:
+    """Streams entries to disk; the index is written on close."""
+
+    def __init__(self, path, vehicle_id):
+        self.path = path
+        self.vehicle_id = vehicle_id
+        fd, self.tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".part")
+        self.f = os.fdopen(fd, "wb")
+        self.f.write(MAGIC)
+        self.entries = {}  # key -> (offset, stored length, raw length, codec, content type id)
+        self.content_types = []
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def add(self, key, data, content_type):
+        if key in self.entries:
+            return
+        codec, stored = CODEC_RAW, data
+        if not content_type or not content_type.startswith("image/"):
+            packed = zlib.compress(data, ZLIB_LEVEL)
+            if len(packed) <= len(data) * (1 - MIN_SAVING):
+                codec, stored = CODEC_ZLIB, packed
+        if content_type not in self.content_types:
+            self.content_types.append(content_type)
+        self.entries[key] = (self.f.tell(), len(stored), len(data), codec, self.content_types.index(content_type))
+        self.f.write(stored)
+
+    def add_json(self, key, body):
+        self.add(key, json.dumps(body, separators=(",", ":")).encode("utf-8"), JSON_TYPE)
+
+    def close(self):
+        records = sorted((key_hash(key), key, entry) for key, entry in self.entries.items())
+        keys = bytearray()
+        index = bytearray()
+        for digest, key, (offset, length, raw_length, codec, type_id) in records:
+            encoded = key.encode("utf-8")
+            index += INDEX_RECORD.pack(digest, offset, length, raw_length, len(keys), len(encoded), codec, type_id)
+            keys += encoded
+
+        index_offset = self.f.tell()
+        self.f.write(index)
+        keys_offset = self.f.tell()
+        self.f.write(keys)
+        meta = json.dumps({
+            "vehicleId": self.vehicle_id,
+            "created": datetime.now(timezone.utc).isoformat(),
+            "contentTypes": self.content_types,
+        }).encode("utf-8")
+        meta_offset = self.f.tell()
+        self.f.write(meta)
+        self.f.write(FOOTER.pack(index_offset, keys_offset, meta_offset, len(meta), len(records), MAGIC))
+        self.f.close()
+        os.replace(self.tmp_path, self.path)
+
+
+class VehicleBundle:
+    """Random-access reader over an mmapped bundle."""
+
+    def __init__(self, path):
+        self.f = open(path, "rb")
+        try:
+            self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            self.f.close()
+            raise ValueError(f"{path} is not a vehicle bundle")
+        self.view = memoryview(self.mm)
+        if len(self.mm) < len(MAGIC) + FOOTER.size or self.mm[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a vehicle bundle")
+        (self.index_offset, self.keys_offset, meta_offset, meta_length,
+         self.count, magic) = FOOTER.unpack_from(self.mm, len(self.mm) - FOOTER.size)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is truncated")
+        meta = json.loads(self.mm[meta_offset:meta_offset + meta_length])
+        self.vehicle_id = meta["vehicleId"]
+        self.created = datetime.fromisoformat(meta["created"])
+        self.content_types = meta["contentTypes"]
+
+    def close(self):
+        """Unmap the bundle.
+
+        Memoryviews returned by get() should be released first; if any are still
+        alive the map stays valid until the last one is released or collected.
+        """
+        self.view.release()
+        try:
+            self.mm.close()
+        except BufferError:
+            pass  # exported slices hold the map; it is unmapped when they go
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, path):
+        return self._find(bundle_key(path)) is not None
+
+    def _record(self, i):
+        return INDEX_RECORD.unpack_from(self.mm, self.index_offset + i * INDEX_RECORD.size)
+
+    def _key(self, record):
+        start = self.keys_offset + record[4]
+        return self.mm[start:start + record[5]].decode("utf-8")
+
+    def _find(self, key):
+        digest = key_hash(key)
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = self.index_offset + mid * INDEX_RECORD.size
+            if self.mm[start:start + 16] < digest:
+                lo = mid + 1
+            else:
+                hi = mid
+        # Equal hashes are adjacent; compare keys to rule out collisions
+        while lo < self.count:
+            record = self._record(lo)
+            if record[0] != digest:
+                break
+            if self._key(record) == key:
+                return record
+            lo += 1
+        return None
+
+    def keys(self):
+        for i in range(self.count):
+            yield self._key(self._record(i))
+
+    def get(self, path):
+        """Return (content_type, body) for a proxy path, or None.
+
+        Raw entries are memoryviews into the map, so no copy is made; release()
+        them when done. Compressed entries are inflated to bytes.
+        """
+        record = self._find(bundle_key(path))
+        if record is None:
+            return None
+        return self._read(record)
+
+    def _read(self, record):
+        _, offset, length, _, _, _, codec, type_id = record
+        body = self.view[offset:offset + length]
+        if codec == CODEC_ZLIB:
+            with body as packed:
+                body = zlib.decompress(packed)
+        return self.content_types[type_id], body
+
+    def verify(self):
+        """Read every entry back and check it against its index record.
+
+        Returns a list of (key, problem) for entries that fail.
+        """
+        problems = []
+        for i in range(self.count):
+            record = self._record(i)
+            key = self._key(record)
+            if self._find(key) != record:
+                problems.append((key, "not found by key"))
+                continue
+            try:
+                content_type, body = self._read(record)
+            except zlib.error as e:
+                problems.append((key, f"corrupt ({e})"))
+                continue
+            try:
+                if len(body) != record[3]:
+                    problems.append((key, f"{len(body)} bytes, index says {record[3]}"))
+                elif content_type == JSON_TYPE:
+                    json.loads(bytes(body))
+            except ValueError as e:
+                problems.append((key, f"bad JSON ({e})"))
+            finally:
+                if isinstance(body, memoryview):
+                    body.release()
+        return problems
+
+    def get_json(self, path):
+        """Return a JSON route wrapped the way the proxy sends it ({header, body}), or None."""
+        item = self.get(path)
+        if item is None:
+            return None
+        content_type, body = item
+        try:
+            if content_type != JSON_TYPE:
+                return None
+            return {
+                "header": {"status": "OK", "statusCode": 200, "date": format_datetime(self.created, usegmt=True)},
+                "body": json.loads(bytes(body)),
+            }
+        finally:
+            if isinstance(body, memoryview):
+                body.release()
+
+
+class BundleRequestHandler(BaseHTTPRequestHandler):
+    """Serves a bundle over the proxy's routes."""
+
+    bundle = None
+
+    def do_GET(self):
+        path = bundle_key(self.path)
+        item = self.bundle.get(path)
+        if item is None:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        content_type, body = item
+        try:
+            data = body
+            if content_type == JSON_TYPE:
+                data = json.dumps(self.bundle.get_json(path)).encode("utf-8")
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        finally:
+            # Raw bodies are views into the map; release them so the bundle can be closed
+            if isinstance(body, memoryview):
+                body.release()
+
+
+def serve(path, port):
+    BundleRequestHandler.bundle = VehicleBundle(path)
+    server = ThreadingHTTPServer(("", port), BundleRequestHandler)
+    print(f"📦 Serving {BundleRequestHandler.bundle.vehicle_id} from '{path}' on http://localhost:{port}/api/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        BundleRequestHandler.bundle.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline per-vehicle content bundles")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    exp = sub.add_parser("export", help="Pack a vehicle into a bundle")
+    exp.add_argument("vehicle_id")
+    exp.add_argument("--out", help="Output file (default: <vehicleId>.bundle)")
+
+    ls = sub.add_parser("ls", help="List the routes in a bundle")
+    ls.add_argument("bundle")
+
+    get = sub.add_parser("get", help="Print one route from a bundle")
+    get.add_argument("bundle")
+    get.add_argument("path", help="Proxy path, e.g. source/MOTOR/vehicle/{vehicleId}/dtcs")
+
+    chk = sub.add_parser("check", help="Read every entry back and report any that fail")
+    chk.add_argument("bundle")
+
+    srv = sub.add_parser("serve", help="Serve a bundle over HTTP")
+    srv.add_argument("bundle")
+    srv.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        # Imported here so ls/get/serve don't need the crawl stack
+        from bundle_export import export
+
+        out = args.out or re.sub(r'[^\w.-]', '_', args.vehicle_id) + ".bundle"
+        asyncio.run(export(args.vehicle_id, out))
+    elif args.command == "serve":
+        serve(args.bundle, args.port)
+    else:
+        with VehicleBundle(args.bundle) as bundle:
+            if args.command == "ls":
+                for key in sorted(bundle.keys()):
+                    print(key)
+            elif args.command == "check":
+                problems = bundle.verify()
+                for key, problem in problems:
+                    print(f"❌ {key}: {problem}")
+                if not problems:
+                    print(f"✅ {len(bundle)} entries read back")
+            else:
+                item = bundle.get(args.path)
+                if item is None:
+                    print(f"❌ {args.path} not in bundle")
+                elif item[0] == JSON_TYPE:
+                    print(json.dumps(bundle.get_json(args.path), indent=2))
+                else:
+                    print(f"{item[0]}, {len(item[1])} bytes")
+                # Raw bodies are views into the map and must go before it is closed
+                if item and isinstance(item[1], memoryview):
+                    item[1].release()
+
+
+if __name__ == "__main__":
+    main()